@@ -1,5 +1,7 @@
+from typing import Tuple
 import argparse
 import logging
+import sys
 
 logging.basicConfig(level="DEBUG", format="%(name)s [%(levelname)s] %(message)s")
 logging.getLogger("trimesh").setLevel("WARN")
@@ -8,13 +10,50 @@ logging.getLogger("OpenGL.arrays.arraydatatype").setLevel("WARN")
 logging.getLogger("OpenGL.acceleratesupport").setLevel("WARN")
 logging.getLogger("PIL.PngImagePlugin").setLevel("WARN")
 
-if __name__ == "__main__":
+def shard(value:str) -> Tuple[int, int]:
+    index, count = (int(x) for x in value.split("/"))
+    if not 1 <= index <= count: raise ValueError(value)
+    return index, count
+
+if __name__ == "__main__" and sys.argv[1:2] == ["merge"]:
+    parser = argparse.ArgumentParser(prog="rendermite merge", description="Combine the outputs of every shard into a single output directory.")
+    parser.add_argument("shards", metavar="shard", type=str, nargs="+", help="The output directory of each shard.")
+    parser.add_argument("-o", "--output", metavar="path", type=str, help="The output location to save the combined images.", default=r"./output/", required=False)
+    parser.add_argument("--compress-level", metavar="0-9", type=int, choices=range(10), help="How hard to compress combined atlas sheets, trading speed for size.", default=6, required=False)
+    args = parser.parse_args(sys.argv[2:])
+
+    from rendermite.exceptions import MergeError
+    from rendermite.merge import merge_outputs
+    try: merge_outputs(args.shards, args.output, args.compress_level)
+    except MergeError as ex:
+        logging.getLogger("rendermite").error(f"Could not merge shards: {ex}")
+        sys.exit(1)
+
+elif __name__ == "__main__":
     parser = argparse.ArgumentParser(prog="rendermite", description="Rendermite - A tool to generate the inventory icons for every Minecraft item.")
     parser.add_argument("-v", "--version", metavar="version", type=str, help="The version of Minecraft to generate from.", default="latest", required=True)
     parser.add_argument("-o", "--output", metavar="path", type=str, help="The output location to save the images.", default=r"./output/", required=False)
     parser.add_argument("-t", "--tempdir", metavar="path", type=str, help="The location minecraft assets should be temporarily downloaded to.", default=r"./tmp/", required=False)
     parser.add_argument("-p", "--processes", metavar="", type=int, help="The number of child processes used for generating textures", default=0, required=False)
+    parser.add_argument("-c", "--cachedir", metavar="path", type=str, help="The location downloaded Minecraft versions are cached in between runs.", default=r"./cache/", required=False)
+    parser.add_argument("--no-cache", action="store_true", help="Do not keep downloaded Minecraft versions between runs.")
+    parser.add_argument("--prune-cache", action="store_true", help="Remove every cached Minecraft version except the one being generated.")
+    parser.add_argument("-f", "--force", action="store_true", help="Regenerate every item, even if it is unchanged since the last run.")
+    parser.add_argument("-r", "--resolution", metavar="pixels", type=int, help="The resolution block items are rendered at.", default=1024, required=False)
+    parser.add_argument("-s", "--sizes", metavar="pixels", type=int, nargs="+", help="Save each item at these sizes instead of its native size, each into its own directory.", default=None, required=False)
+    parser.add_argument("--format", type=str, choices=["png", "webp"], help="The image format items are saved in, webp images are lossless.", default="png", required=False)
+    parser.add_argument("--compress-level", metavar="0-9", type=int, choices=range(10), help="How hard to compress saved images, trading speed for size.", default=6, required=False)
+    parser.add_argument("--atlas", action="store_true", help="Pack every item into atlas sheets with a JSON index instead of saving individual images.")
+    parser.add_argument("--pipeline", action="store_true", help="Overlap loading, rendering and saving items in separate stages, using the child processes not rendering for loading.")
+    parser.add_argument("--gl-workers", metavar="", type=int, help="The number of child processes rendering in pipeline mode.", default=1, required=False)
+    parser.add_argument("--batch-render", action="store_true", help="Render several block items at a time, reading them back from OpenGL together.")
+    parser.add_argument("--stats", metavar="path", type=str, help="Save the time spent in each stage and peak memory of every item, as CSV if the path ends with .csv, otherwise JSON.", default=None, required=False)
+    parser.add_argument("--profile", metavar="path", type=str, help="Profile every process generating items, merging the results into this file.", default=None, required=False)
+    parser.add_argument("--shard", metavar="i/N", type=shard, help="Only generate the i-th of N shards of roughly equal cost, to be combined with merge.", default=None, required=False)
+    parser.add_argument("--backend", type=str, choices=["pyrender", "numpy", "auto"], help="Render block items with OpenGL, rasterize them in NumPy without OpenGL, or rasterize only simple items.", default="pyrender", required=False)
+    parser.add_argument("--no-extract", action="store_true", help="Read assets straight from the client jar instead of extracting them first.")
+    parser.add_argument("--start-method", type=str, choices=["fork", "spawn", "forkserver"], help="How child processes are started, forkserver imports the renderer once and starts every child from it.", default=None, required=False)
     args = parser.parse_args()
 
     from rendermite.cli import run_generator
-    run_generator(args.version, args.tempdir, args.output, args.processes)
\ No newline at end of file
+    run_generator(args.version, args.tempdir, args.output, args.processes, None if args.no_cache else args.cachedir, args.prune_cache, args.force, args.resolution, args.sizes, args.format, args.compress_level, args.atlas, args.pipeline, args.gl_workers, args.stats, args.profile, args.start_method, args.shard, args.batch_render, args.backend, not args.no_extract)
\ No newline at end of file
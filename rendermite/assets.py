@@ -0,0 +1,121 @@
+from rendermite.download import is_render_asset
+from typing import BinaryIO, Dict, List, Tuple
+from io import BytesIO
+import zipfile
+import struct
+import mmap
+import zlib
+import os
+
+OVERRIDES_LOCATION = os.path.join(os.path.split(__file__)[0], "overrides")
+# Assets are stored inside the client jar under this directory
+JAR_ASSETS = "assets/"
+# The fixed size part of a zip local file header, followed by the file name and extra field
+ZIP_HEADER = struct.Struct("<4s22xHH")
+
+_indexes:Dict[Tuple[str, str], "AssetIndex"] = {}
+
+def _walk(directory:str) -> List[str]:
+    """Lists every file under the directory relative to it"""
+    return [os.path.relpath(os.path.join(root, f), directory) for root, _, files in os.walk(directory) for f in files]
+
+
+class AssetIndex:
+    """Lists every asset under a base path once, so finding and reading assets never needs to check the filesystem.
+
+    The base path is either a directory of extracted assets or a client jar which is read in place, its assets are
+    given paths as though the jar were a directory. Files in the overrides directory replace assets at the same path."""
+
+    def __init__(self, base_path:str, overrides_location:str=OVERRIDES_LOCATION) -> None:
+        self.base_path = os.path.abspath(base_path)
+        self.overrides_location = os.path.abspath(overrides_location)
+        self._overrides = set(_walk(self.overrides_location))
+        self._mapped:mmap.mmap = None
+
+        # Only the central directory of the jar is read here, entries are read from the mapped file when opened
+        if os.path.isfile(self.base_path):
+            with zipfile.ZipFile(self.base_path) as archive: entries = archive.infolist()
+            with open(self.base_path, "rb") as file: self._mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._files = {os.path.join(*e.filename[len(JAR_ASSETS):].split("/")): e for e in entries if is_render_asset(e.filename)}
+        else: self._files = dict.fromkeys(_walk(self.base_path))
+
+        self._directories:Dict[str, List[str]] = {}
+        for path in self._files:
+            directory, name = os.path.split(path)
+            self._directories.setdefault(directory, []).append(name)
+
+    def locate(self, path:str) -> str:
+        """Gets the full path of the asset at the relative path, taking overrides into account"""
+        if path in self._overrides: return os.path.join(self.overrides_location, path)
+        return os.path.join(self.base_path, path)
+
+    def contains(self, path:str) -> bool:
+        """Checks whether the full path is within the base path or overrides, whether or not the file exists"""
+        return self._split(path) is not None
+
+    def exists(self, path:str) -> bool:
+        """Checks whether the asset at the full path exists"""
+        split = self._split(path)
+        if split is None: return os.path.exists(path)
+        override, relative = split
+        return relative in (self._overrides if override else self._files)
+
+    def open(self, path:str) -> BinaryIO:
+        """Opens the asset at the full path for reading in binary mode"""
+        split = self._split(path)
+        if split is None or split[0] or self._mapped is None: return open(path, "rb")
+        entry = self._files.get(split[1])
+        if entry is None: raise FileNotFoundError(f"No such asset: '{path}'")
+        return BytesIO(self._read_entry(entry))
+
+    def listdir(self, directory:str) -> List[str]:
+        """Lists the names of the assets directly within the relative directory, ignoring overrides"""
+        return list(self._directories.get(os.path.normpath(directory), []))
+
+    def _read_entry(self, entry:zipfile.ZipInfo) -> bytes:
+        """Reads an entry of the jar from the mapped file, skipping the local header which precedes its data"""
+        signature, name_length, extra_length = ZIP_HEADER.unpack_from(self._mapped, entry.header_offset)
+        if signature != b"PK\x03\x04": raise zipfile.BadZipFile(f"Bad local header for {entry.filename}")
+        start = entry.header_offset + ZIP_HEADER.size + name_length + extra_length
+        data = self._mapped[start:start+entry.compress_size]
+        if entry.compress_type == zipfile.ZIP_DEFLATED: return zlib.decompress(data, -zlib.MAX_WBITS)
+        if entry.compress_type == zipfile.ZIP_STORED: return data
+        # Other compression methods are never used by client jars, so are left to zipfile
+        with zipfile.ZipFile(self.base_path) as archive: return archive.read(entry)
+
+    def _split(self, path:str) -> "Tuple[bool, str] | None":
+        """Splits a full path into whether it is an override and the path relative to the base or overrides"""
+        for override, root in ((True, self.overrides_location), (False, self.base_path)):
+            if path.startswith(root + os.sep): return override, path[len(root)+1:]
+        return None
+
+
+def get_index(base_path:str, overrides_location:str=OVERRIDES_LOCATION) -> AssetIndex:
+    """Gets the shared ``AssetIndex`` for the specified base path, building it the first time"""
+    key = (base_path, overrides_location)
+    index = _indexes.get(key)
+    if index is None: index = _indexes[key] = AssetIndex(base_path, overrides_location)
+    return index
+
+def _find_jar(path:str) -> "str | None":
+    """Finds the jar containing the path, if it is within one"""
+    parent = os.path.dirname(path)
+    while parent != path and not os.path.exists(parent): path, parent = parent, os.path.dirname(parent)
+    return parent if os.path.isfile(parent) and zipfile.is_zipfile(parent) else None
+
+def _find_index(path:str) -> "AssetIndex | None":
+    index = next((index for index in _indexes.values() if index.contains(path)), None)
+    if index is not None or os.path.exists(path): return index
+    # Paths within a jar are given to processes which never built its index, such as render workers
+    jar = _find_jar(path)
+    return None if jar is None else get_index(jar)
+
+def asset_exists(path:str) -> bool:
+    """Checks whether the file exists, using the index containing it if there is one"""
+    index = _find_index(path)
+    return os.path.exists(path) if index is None else index.exists(path)
+
+def open_asset(path:str) -> BinaryIO:
+    """Opens the file for reading in binary mode, from the index containing it if there is one"""
+    index = _find_index(path)
+    return open(path, "rb") if index is None else index.open(path)
@@ -0,0 +1,258 @@
+"""Benchmarks rendermite against a deterministic synthetic asset pack, without downloading Minecraft.
+
+Run with ``python -m rendermite.benchmark -o results.json`` and compare two runs with ``--compare``."""
+from typing import Callable, Dict, List
+from PIL import Image
+import statistics
+import subprocess
+import platform
+import argparse
+import tempfile
+import logging
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+LOGGER = logging.getLogger(__name__)
+
+FACES = ["down", "up", "north", "south", "west", "east"]
+REGRESSION_THRESHOLD = 0.1
+
+
+def _write_json(root:str, path:str, data:dict):
+    path = os.path.join(root, "minecraft", path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="UTF-8") as file: json.dump(data, file)
+
+def _write_texture(root:str, path:str, rng:random.Random, size:int=16, frames:int=1):
+    path = os.path.join(root, "minecraft", "textures", path+".png")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    im = Image.new("RGBA", (size, size * frames))
+    im.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.choice([0, 255, 255, 255])) for _ in range(size * size * frames)])
+    im.save(path)
+    if frames > 1: # Animated textures are cropped to their first frame
+        with open(path+".mcmeta", "w", encoding="UTF-8") as file: json.dump({"animation": {}}, file)
+
+def generate_assets(root:str, blocks:int=40, generated:int=40, multi:int=20, seed:int=0):
+    """Generates a deterministic synthetic asset tree in the layout extracted from the client jar"""
+    rng = random.Random(seed)
+
+    # Parent models mirroring the vanilla ones
+    _write_json(root, "models/block/block.json", {"gui_light": "side", "display": {"gui": {"rotation": [30, 225, 0], "translation": [0, 0, 0], "scale": [0.625, 0.625, 0.625]}}})
+    _write_json(root, "models/block/cube.json", {"parent": "block/block", "elements": [{"from": [0, 0, 0], "to": [16, 16, 16], "faces": {f: {"texture": f"#{f}", "cullface": f} for f in FACES}}]})
+    _write_json(root, "models/block/cube_all.json", {"parent": "block/cube", "textures": {"particle": "#all"} | {f: "#all" for f in FACES}})
+    _write_json(root, "models/item/generated.json", {"parent": "builtin/generated", "gui_light": "front", "display": {"gui": {"rotation": [0, 0, 0]}}})
+    _write_json(root, "models/item/handheld.json", {"parent": "item/generated"})
+
+    # cube_all blocks, some with animated textures
+    for i in range(blocks):
+        _write_texture(root, f"block/cube_{i}", rng, frames=3 if i % 7 == 0 else 1)
+        _write_json(root, f"models/block/cube_{i}.json", {"parent": "block/cube_all", "textures": {"all": f"block/cube_{i}"}})
+        _write_json(root, f"models/item/cube_{i}.json", {"parent": f"block/cube_{i}"})
+
+    # builtin/generated items with several layers
+    for i in range(generated):
+        layers = 1 + i % 3
+        for layer in range(layers):
+            _write_texture(root, f"item/generated_{i}_{layer}", rng, 16 if i % 5 else 32, 2 if i % 9 == 0 and layer == 0 else 1)
+        parent = "item/generated" if i % 2 else "minecraft:item/handheld"
+        _write_json(root, f"models/item/generated_{i}.json", {"parent": parent, "textures": {f"layer{l}": f"item/generated_{i}_{l}" for l in range(layers)}})
+
+    # Multi-element models with rotated elements and faces
+    for i in range(multi):
+        _write_texture(root, f"block/multi_{i}", rng)
+        elements = []
+        for e in range(2 + i % 6):
+            start = [rng.randrange(0, 12) for _ in range(3)]
+            element = {"from": start, "to": [x + rng.randrange(1, 5) for x in start], "faces": {}}
+            for face in FACES:
+                if rng.random() < .2: continue
+                element["faces"][face] = {"texture": "#texture", "rotation": rng.choice([0, 90, 180, 270])}
+                if e % 2: element["faces"][face]["uv"] = [0, 0, 8, 8]
+            if e % 2: element["rotation"] = {"angle": rng.choice([-45, -22.5, 0, 22.5, 45]), "axis": rng.choice("xyz"), "origin": [8, 8, 8]}
+            elements.append(element)
+        _write_json(root, f"models/block/multi_{i}.json", {"parent": "block/block", "textures": {"texture": f"block/multi_{i}", "particle": "#texture"}, "elements": elements})
+        _write_json(root, f"models/item/multi_{i}.json", {"parent": f"block/multi_{i}"})
+
+
+def _time(timings:Dict[str, List[float]], stage:str, function:Callable, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    timings.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+def _summarise(durations:List[float]) -> dict:
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "total": sum(durations),
+        "mean": statistics.mean(durations),
+        "median": statistics.median(durations),
+        "p95": durations[min(len(durations)-1, int(len(durations) * .95))]
+    }
+
+def benchmark_stages(base:str, repeat:int=1) -> Dict[str, dict]:
+    """Times each generation stage separately for every item in a single process, so no stage includes the time of another"""
+    from rendermite.generator import _prepare_item_model, _create_item_texture, get_renderer
+    from rendermite.converter import mesh_from_geometry
+    from rendermite.textures import load_texture, load_layer
+    from rendermite.loader import MinecraftModel
+    from io import BytesIO
+
+    models = sorted(os.path.splitext(x)[0] for x in os.listdir(os.path.join(base, "minecraft", "models", "item")))
+    timings = {}
+    renderer = get_renderer() # Created up front so creating the OpenGL context is not timed as a render
+    for _ in range(repeat):
+        load_texture.cache_clear()
+        load_layer.cache_clear()
+        for name in models:
+            model = _time(timings, "from_file", MinecraftModel.from_file, f"minecraft:item/{name}", base)
+            if model.builtin is None:
+                item = _time(timings, "prepare_item_model", _prepare_item_model, model)
+                mesh = _time(timings, "mesh_from_geometry", mesh_from_geometry, *item.geometry)
+                im = _time(timings, "render", renderer.render, mesh, item.pose, item.light_pose)
+            elif model.builtin == "builtin/generated":
+                im = _time(timings, "create_item_texture", _create_item_texture, model)
+            else: continue
+            _time(timings, "png_save", im.save, BytesIO(), "png")
+    return {stage: _summarise(d) for stage, d in timings.items()}
+
+def benchmark_scaling(base:str, processes:List[int], resolution:int) -> Dict[str, dict]:
+    """Times generating every item into a temporary output directory with each number of processes"""
+    results = {}
+    for count in processes:
+        # run_generator removes its asset directory once done
+        assets = tempfile.mkdtemp(prefix="rendermite-assets-")
+        shutil.copytree(base, assets, dirs_exist_ok=True)
+        output = tempfile.mkdtemp(prefix="rendermite-output-")
+        code = (
+            "import sys, time\n"
+            "from rendermite.cli import run_generator\n"
+            "import rendermite.cli as cli\n"
+            "cli.download_assets = lambda version, output, *a, **k: output\n"
+            "start = time.perf_counter()\n"
+            f"run_generator('', sys.argv[1], sys.argv[2], {count}, force=True, resolution={resolution})\n"
+            "print(time.perf_counter() - start)\n"
+        )
+        # Each run gets a fresh interpreter so caches and GL contexts do not carry over
+        process = subprocess.run([sys.executable, "-c", code, assets, output], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        seconds = float(process.stdout.strip().splitlines()[-1])
+        items = len([f for f in os.listdir(output) if f.endswith(".png")])
+        shutil.rmtree(output)
+        results[str(count)] = {"seconds": seconds, "items": items, "items_per_second": items / seconds}
+        LOGGER.info("%s processes: %s items in %.2fs", count, items, seconds)
+    return results
+
+
+def benchmark_backends(base:str, resolution:int) -> Dict[str, dict]:
+    """Renders every block item with each backend, comparing the rasterized images against pyrender"""
+    from rendermite.generator import ItemGeometry, prepare_item, get_renderer
+    from rendermite.rasterizer import rasterize_geometry
+    from rendermite.converter import mesh_from_geometry
+    import numpy as np
+
+    items = []
+    for name in sorted(os.path.splitext(x)[0] for x in os.listdir(os.path.join(base, "minecraft", "models", "item"))):
+        item = prepare_item(f"minecraft:item/{name}", base)
+        if isinstance(item, ItemGeometry): items.append(item)
+
+    renderer = get_renderer()
+    def render(item:ItemGeometry) -> Image.Image:
+        return renderer.render(mesh_from_geometry(*item.geometry), item.pose, item.light_pose)
+
+    timings = {}
+    for item in items:
+        expected = _time(timings, "pyrender", render, item)
+        actual = _time(timings, "numpy", rasterize_geometry, *item.geometry, item.pose, item.light_pose, [resolution, resolution])
+        difference = np.abs(np.asarray(expected, int) - np.asarray(actual, int)).max(axis=2)
+        timings.setdefault("differing", []).append((difference > 0).mean())
+        timings.setdefault("max_difference", []).append(int(difference.max()))
+
+    results = {backend: {"items_per_second": len(items) / sum(timings[backend])} for backend in ("pyrender", "numpy")}
+    results["numpy"]["differing_pixels"] = statistics.mean(timings["differing"])
+    results["numpy"]["max_difference"] = max(timings["max_difference"])
+    LOGGER.info("pyrender %.2f/s, numpy %.2f/s with %.3f%% of pixels differing by up to %s", results["pyrender"]["items_per_second"],
+        results["numpy"]["items_per_second"], results["numpy"]["differing_pixels"]*100, results["numpy"]["max_difference"])
+    return results
+
+def _git_commit() -> str:
+    try: return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError: return None
+
+def compare_results(previous:dict, current:dict, threshold:float=REGRESSION_THRESHOLD) -> List[str]:
+    """Compares two benchmark results, returning a description of every regression beyond the threshold"""
+    regressions = []
+    for stage, stats in current["stages"].items():
+        old = previous["stages"].get(stage)
+        if old is None: continue
+        change = stats["mean"] / old["mean"] - 1
+        LOGGER.info("%-20s %8.2fms -> %8.2fms (%+.1f%%)", stage, old["mean"]*1000, stats["mean"]*1000, change*100)
+        if change > threshold: regressions.append(f"{stage} mean is {change:.1%} slower")
+    for count, stats in current["scaling"].items():
+        old = previous["scaling"].get(count)
+        if old is None: continue
+        change = old["items_per_second"] / stats["items_per_second"] - 1
+        LOGGER.info("-p %-17s %8.2f/s -> %8.2f/s", count, old["items_per_second"], stats["items_per_second"])
+        if change > threshold: regressions.append(f"-p {count} throughput is {change:.1%} slower")
+    for backend, stats in current.get("backends", {}).items():
+        old = previous.get("backends", {}).get(backend)
+        if old is None: continue
+        change = old["items_per_second"] / stats["items_per_second"] - 1
+        LOGGER.info("%-20s %8.2f/s -> %8.2f/s", backend, old["items_per_second"], stats["items_per_second"])
+        if change > threshold: regressions.append(f"{backend} backend throughput is {change:.1%} slower")
+    return regressions
+
+def run_benchmark(processes:List[int], resolution:int, repeat:int=1, seed:int=0, assets:str=None) -> dict:
+    """Generates the synthetic assets and runs every benchmark, returning the machine readable results"""
+    base = assets or tempfile.mkdtemp(prefix="rendermite-assets-")
+    try:
+        generate_assets(base, seed=seed)
+        from rendermite.generator import init_renderer
+        init_renderer([resolution, resolution])
+        return {
+            "meta": {
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "resolution": resolution,
+                "seed": seed,
+                "time": time.time()
+            },
+            "stages": benchmark_stages(base, repeat),
+            "scaling": benchmark_scaling(base, processes, resolution),
+            "backends": benchmark_backends(base, resolution)
+        }
+    finally:
+        if assets is None: shutil.rmtree(base)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO", format="%(name)s [%(levelname)s] %(message)s")
+    logging.getLogger("OpenGL.acceleratesupport").setLevel("WARN")
+    logging.getLogger("PIL.PngImagePlugin").setLevel("WARN")
+    parser = argparse.ArgumentParser(prog="rendermite.benchmark", description="Benchmarks rendermite using a synthetic asset pack.")
+    parser.add_argument("-o", "--output", metavar="path", type=str, help="The file to write the JSON results to.", default=None, required=False)
+    parser.add_argument("-p", "--processes", metavar="", type=int, nargs="+", help="The process counts to measure scaling with.", default=[1, 2, 4], required=False)
+    parser.add_argument("-r", "--resolution", metavar="pixels", type=int, help="The resolution block items are rendered at.", default=1024, required=False)
+    parser.add_argument("-n", "--repeat", metavar="", type=int, help="How many times each stage is timed per item.", default=1, required=False)
+    parser.add_argument("-c", "--compare", metavar="path", type=str, help="Previous results to check for regressions against.", default=None, required=False)
+    parser.add_argument("--assets", metavar="path", type=str, help="Keep the generated synthetic assets in this directory.", default=None, required=False)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.processes, args.resolution, args.repeat, assets=args.assets)
+    for stage, stats in results["stages"].items():
+        LOGGER.info("%-20s mean %8.2fms  p95 %8.2fms  total %7.2fs", stage, stats["mean"]*1000, stats["p95"]*1000, stats["total"])
+    if args.output is not None:
+        with open(args.output, "w", encoding="UTF-8") as file: json.dump(results, file, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="UTF-8") as file: previous = json.load(file)
+        regressions = compare_results(previous, results)
+        for regression in regressions: LOGGER.warning("Regression: %s", regression)
+        if regressions: sys.exit(1)
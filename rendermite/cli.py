@@ -1,36 +1,283 @@
-from rendermite.exceptions import OrphanModelError, MissingDisplayError, UnsupportedBuiltinError
-from rendermite.download import download_assets
-from rendermite.generator import generate_item
-from urllib.error import HTTPError
-from multiprocessing import Pool
+from rendermite.exceptions import LoaderError, OrphanModelError, MissingDisplayError, UnsupportedBuiltinError, RenderWorkerError
+from rendermite.download import download_assets, AssetCache
+from rendermite.generator import ItemGeometry, generate_item, prepare_item, render_geometries, init_renderer, get_batch_size, RENDER_RESOLUTION
+from rendermite.manifest import model_hash, render_key, read_manifest, save_manifest
+from rendermite.output import OutputSettings, save_images, save_atlas, spill_outputs, link_image, resize_outputs
+from rendermite.loader import get_repository
+from rendermite.assets import get_index
+from rendermite.sprites import process_sprites, SPRITE_BATCH_SIZE
+from rendermite.pipeline import run_pipeline, estimate_cost
+from rendermite.profiling import record_item, record_error, share_record, stage, init_instrumentation, stop_profiler, merge_profiles, log_summary, save_records
+from multiprocessing.context import BaseContext
+from urllib.error import URLError
+from typing import Dict, List, Tuple
+from PIL import Image
 from itertools import repeat
+import multiprocessing
+import tracemalloc
+import importlib
+import hashlib
+import tempfile
 import logging
 import shutil
 import os
 
 LOGGER = logging.getLogger("rendermite")
 
-def process_model(model:str, base:str, output:str):
+# Modules imported before starting workers, rendering workers also need OpenGL which is slow to import
+WORKER_MODULES = ["rendermite.cli"]
+RENDER_MODULES = ["pyrender"]
+
+def render_model(model:str, base:str, sizes:List[int]=None) -> Dict[int, Image.Image]:
+    """Generates the item at each output size, or ``None`` if the item could not be generated"""
     try: im = generate_item(f"minecraft:item/{model}", base)
-    except (OrphanModelError, MissingDisplayError, UnsupportedBuiltinError) as ex:
+    except (OrphanModelError, MissingDisplayError, UnsupportedBuiltinError, RenderWorkerError) as ex:
         LOGGER.warning("Error generating %s: %s", model, ex)
-        return
-    im.save(open(os.path.join(output, f"{model}.png"), "wb"), "png")
-    print(f"Generated {model}")
+        record_error(ex)
+        return None
+    with stage("resize"): return resize_outputs(im, sizes) if sizes else {None: im}
+
+def process_models(models:List[str], base:str, settings:OutputSettings) -> List[Tuple[dict, Dict[int, Image.Image]]]:
+    """Generates and saves a batch of items one at a time, returning the record and, when generating an atlas, images of each.
+
+    Each item is saved while the next is generated, waiting for every image once the batch is done.
+    Time spent waiting is shared evenly between the records of the saved items."""
+    results:List[Tuple[dict, Dict[int, Image.Image]]] = []
+    saving:Dict[str, list] = {}
+    for model in models:
+        with record_item(model) as record:
+            outputs = render_model(model, base, settings.sizes)
+            if outputs is not None and settings.atlas:
+                with stage("spill"): outputs = spill_outputs(model, outputs, settings)
+            elif outputs is not None:
+                with stage("save"): saving[model] = save_images({path: outputs[size] for size, path in settings.paths(model).items()}, settings, wait=False)
+        results.append((record, outputs if settings.atlas else None))
+    if not saving: return results
+
+    with record_item(None) as batch:
+        with stage("save"):
+            for futures in saving.values():
+                for future in futures: future.result()
+    share_record(batch, [r for r, _ in results if r["item"] in saving])
+    for model in saving: print(f"Generated {model}")
+    return results
+
+def process_renders(models:List[str], base:str, settings:OutputSettings) -> List[Tuple[dict, Dict[int, Image.Image]]]:
+    """Generates and saves a batch of block items, rendering them together, returning the record and, when generating an atlas, images of each.
+
+    Time spent rendering and saving the whole batch is shared evenly between the records of its items."""
+    results:Dict[str, Tuple[dict, Dict[int, Image.Image]]] = {}
+    items:Dict[str, ItemGeometry] = {}
+    for model in models:
+        with record_item(model) as record:
+            results[model] = record, None
+            try: items[model] = prepare_item(f"minecraft:item/{model}", base)
+            except (OrphanModelError, MissingDisplayError, UnsupportedBuiltinError) as ex:
+                LOGGER.warning("Error generating %s: %s", model, ex)
+                record_error(ex)
+    if not items: return list(results.values())
+
+    error = None
+    with record_item(None) as batch:
+        try: images = render_geometries(list(items.values()))
+        except RenderWorkerError as ex: error = ex
+        else:
+            with stage("resize"): outputs = [resize_outputs(im, settings.sizes) if settings.sizes else {None: im} for im in images]
+    share_record(batch, [results[m][0] for m in items])
+    if error is not None:
+        for model in items:
+            LOGGER.warning("Error generating %s: %s", model, error)
+            record_error(error, results[model][0])
+        return list(results.values())
+    saves = {}
+    for model, output in zip(items, outputs):
+        if settings.atlas: results[model] = results[model][0], spill_outputs(model, output, settings)
+        else: saves |= {path: output[size] for size, path in settings.paths(model).items()}
+
+    # Encode every image in the batch in parallel
+    if saves:
+        with record_item(None) as batch: save_images(saves, settings)
+        share_record(batch, [results[m][0] for m in items])
+        for model in items: print(f"Generated {model}")
+    return list(results.values())
+
+def split_sprites(models:List[str], base:str) -> Tuple[List[str], List[str]]:
+    """Splits the items into ``builtin/generated`` items, which do not need OpenGL, and every other item"""
+    repository = get_repository(base)
+    sprites, others = [], []
+    for model in models:
+        try: generated = repository.resolve("minecraft", f"item/{model}").builtin == "builtin/generated"
+        except LoaderError: generated = False
+        (sprites if generated else others).append(model)
+    return sprites, others
+
+def _init_worker(resolution:List[int], backend:str, trace_memory:bool, profile_dir:str):
+    init_renderer(resolution, backend)
+    init_instrumentation(trace_memory, profile_dir)
+
+def find_changed(models:List[str], base:str, output:OutputSettings, settings:dict, force:bool=False) -> Tuple[List[str], Dict[str, str]]:
+    """Compares the items against the output manifest, returning the items to generate and the hashes of all items"""
+    repository = get_repository(base)
+    data = read_manifest(output.directory) or {"settings": None, "items": {}}
+    hashes = {}
+    for model in models:
+        try: hashes[model] = model_hash(repository.get(f"minecraft:item/{model}"))
+        except LoaderError: pass # Reported when generated
+
+    # Remove outputs for items that no longer exist, where the previous run saved them, whatever is regenerated
+    saved = data["settings"] or {}
+    written = OutputSettings(output.directory, saved.get("sizes"), saved.get("format", "png"))
+    for model in data["items"].keys() - set(models):
+        LOGGER.info("Removing %s", model)
+        for path in written.paths(model).values():
+            if os.path.exists(path): os.remove(path)
+
+    previous = {} if force or data["settings"] != settings else data["items"]
+
+    changed = [m for m in models if hashes.get(m) is None or previous.get(m) != hashes[m]
+        or not all(os.path.exists(p) for p in output.paths(m).values())]
+    return changed, hashes
 
-def run_generator(version:str, temp_dir:str, output:str, max_children:int):
+def group_duplicates(models:List[str], base:str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Groups the items which generate identical images, returning the items to generate and the duplicates of each"""
+    repository = get_repository(base)
+    groups:Dict[str, List[str]] = {}
+    unique = []
+    for model in models:
+        try: key = render_key(repository.get(f"minecraft:item/{model}"))
+        except LoaderError: key = None # Reported when generated
+        if key is None: unique.append(model)
+        elif key in groups: groups[key].append(model)
+        else:
+            groups[key] = [model]
+            unique.append(model)
+    return unique, {group[0]: group[1:] for group in groups.values() if len(group) > 1}
+
+def partition_models(models:List[str], base:str, count:int) -> List[List[str]]:
+    """Deterministically splits the items into shards of roughly equal estimated cost.
+
+    Items generating identical images are kept in the same shard so each image is only generated once."""
+    repository = get_repository(base)
+    unique, duplicates = group_duplicates(sorted(models), base)
+    costs = {}
+    for model in unique:
+        try: costs[model] = estimate_cost(repository.resolve("minecraft", f"item/{model}"))
+        except LoaderError: costs[model] = 1
+
+    # Give the most expensive remaining item to the shard with the least work each time
+    shards:List[List[str]] = [[] for _ in range(count)]
+    loads = [0] * count
+    for model in sorted(unique, key=lambda m: (-costs[m], m)):
+        index = min(range(count), key=lambda i: (loads[i], i))
+        shards[index] += [model, *duplicates.get(model, [])]
+        loads[index] += costs[model]
+    return [sorted(shard) for shard in shards]
+
+def get_context(start_method:str=None, modules:List[str]=WORKER_MODULES) -> BaseContext:
+    """Gets the multiprocessing context for the start method, importing the modules workers need once before any are started.
+
+    Forked workers inherit the modules from this process and forkserver workers from the server, spawned workers import them themselves."""
+    context = multiprocessing.get_context(start_method)
+    method = context.get_start_method()
+    if method == "fork":
+        for module in modules: importlib.import_module(module)
+    elif method == "forkserver": context.set_forkserver_preload(modules)
+    return context
+
+def run_generator(version:str, temp_dir:str, output:str, max_children:int, cache_dir:str=None, prune_cache:bool=False, force:bool=False,
+resolution:int=RENDER_RESOLUTION[0], sizes:List[int]=None, format:str="png", compress_level:int=6, atlas:bool=False,
+pipeline:bool=False, gl_workers:int=1, stats:str=None, profile:str=None, start_method:str=None, shard:Tuple[int, int]=None, batch_render:bool=False,
+backend:str="pyrender", extract:bool=True):
+    # Images going into atlases are spilled to disk by the workers rather than held in memory until packed
+    spill_dir = tempfile.mkdtemp(prefix="rendermite-atlas-") if atlas else None
+    settings = OutputSettings(output, sizes, format, compress_level, atlas, spill_dir=spill_dir)
+    cache = AssetCache(cache_dir) if cache_dir is not None else None
+    profile_dir = tempfile.mkdtemp(prefix="rendermite-profile-") if profile is not None else None
+    instrumentation = (stats is not None, profile_dir)
     try:
-        download_assets(version, temp_dir)
-        items_location = os.path.join(temp_dir, "minecraft", "models", "item")
-        models = [os.path.splitext(x)[0] for x in os.listdir(items_location)]
+        base = download_assets(version, temp_dir, cache=cache, extract=extract)
+        # Only pruned once the version being generated is cached, so a failed download never empties the cache
+        if prune_cache and cache is not None: cache.prune()
+        items_location = os.path.join("minecraft", "models", "item")
+        models = sorted(os.path.splitext(x)[0] for x in get_index(base).listdir(items_location))
         LOGGER.info(f"Found {len(models)} items to generate")
-        os.makedirs(output, exist_ok=True)
-        if max_children < 2:
-            for model in models: process_model(model, temp_dir, output)
+        for directory in settings.directories().values(): os.makedirs(directory, exist_ok=True)
+        get_repository(base).preload()
+
+        # Every shard partitions the same item list, recording it so the outputs can be merged and verified
+        shard_info = None
+        if shard is not None:
+            index, count = shard
+            assigned = partition_models(models, base, count)[index - 1]
+            LOGGER.info(f"Generating shard {index}/{count} with {len(assigned)} items")
+            digest = hashlib.sha1("\n".join(models).encode()).hexdigest()
+            shard_info = {"index": index, "count": count, "total": len(models), "digest": digest, "items": assigned}
+            models = assigned
+
+        # Atlases contain every item, so they are always generated in full
+        manifest_settings = {"resolution": resolution, **settings.to_dict()}
+        # Rasterized images differ slightly from OpenGL renders, recorded only when used so existing outputs stay valid
+        if backend != "pyrender": manifest_settings["backend"] = backend
+        changed, hashes = find_changed(models, base, settings, manifest_settings, force or atlas)
+        LOGGER.info(f"Skipping {len(models) - len(changed)} unchanged items")
+        unique, duplicates = group_duplicates(changed, base)
+        if changed: LOGGER.info(f"Generating {len(unique)} unique images for {len(changed)} items, deduplicating {1 - len(unique) / len(changed):.1%}")
+
+        # Generated items are composited in batches by workers which never use OpenGL
+        sprites, renders = split_sprites(unique, base)
+        batches = [sprites[i:i+SPRITE_BATCH_SIZE] for i in range(0, len(sprites), SPRITE_BATCH_SIZE)]
+        size = get_batch_size([resolution, resolution])
+        render_batches = [renders[i:i+size] for i in range(0, len(renders), size)]
+        if max_children < 2 and not pipeline:
+            init_instrumentation(*instrumentation)
+            results = [r for batch in batches for r in process_sprites(batch, base, settings)]
+            if renders: init_renderer([resolution, resolution], backend)
+            if batch_render: results += [r for batch in render_batches for r in process_renders(batch, base, settings)]
+            else: results += [r for batch in render_batches for r in process_models(batch, base, settings)]
+            if profile_dir is not None: stop_profiler(profile_dir)
+            if tracemalloc.is_tracing(): tracemalloc.stop()
         else:
-            with Pool(max_children) as p:
-                p.starmap(process_model, zip(models, repeat(temp_dir), repeat(output)))
-    except HTTPError as ex:
+            context = get_context(start_method, WORKER_MODULES + RENDER_MODULES if renders and backend != "numpy" else WORKER_MODULES)
+            if pipeline:
+                # Rendering processes count towards the child processes, generated items are composited by the loading processes
+                renderers = gl_workers if renders else 0
+                results = list(run_pipeline(renders, base, settings, [resolution, resolution], max(max_children - renderers, 1), renderers,
+                    *instrumentation, context, batch_render, backend, batches).values())
+            else:
+                # Generated items share the pool so no more than the child processes are ever started, the renderer is only
+                # created by the first block item a process renders so processes generating only sprites never touch OpenGL
+                with context.Pool(max_children, initializer=_init_worker, initargs=([resolution, resolution], backend, *instrumentation)) as p:
+                    pending = p.starmap_async(process_sprites, zip(batches, repeat(base), repeat(settings)))
+                    if batch_render: results = [r for batch in p.starmap(process_renders, zip(render_batches, repeat(base), repeat(settings))) for r in batch]
+                    else: results = [r for batch in p.starmap(process_models, zip(render_batches, repeat(base), repeat(settings))) for r in batch]
+                    results += [r for batch in pending.get() for r in batch]
+                    p.close()
+                    p.join()
+
+        records = [record for record, _ in results]
+        failed = {r["item"] for r in records if r["error"] is not None}
+        if atlas:
+            aliases = {d:m for m, copies in duplicates.items() for d in copies}
+            for size, directory in settings.directories().items():
+                save_atlas({r["item"]:o[size] for r, o in results if o is not None}, directory, settings, aliases)
+            LOGGER.info("Saved atlases")
+        else:
+            for model, copies in duplicates.items():
+                if model in failed: continue
+                for size, source in settings.paths(model).items():
+                    for copy in copies: link_image(source, settings.paths(copy)[size])
+
+        log_summary(records)
+        if stats is not None: save_records(records, stats)
+        if profile is not None: merge_profiles(profile_dir, profile)
+
+        # Failed items are left out so they are attempted again next run
+        failed |= {d for m in failed for d in duplicates.get(m, [])}
+        save_manifest(output, {m:h for m,h in hashes.items() if m not in failed}, manifest_settings, shard_info)
+    except URLError as ex:
         LOGGER.error(f"Could not download assets: {ex}")
-    shutil.rmtree(temp_dir)
+    finally:
+        if profile_dir is not None: shutil.rmtree(profile_dir, ignore_errors=True)
+        if spill_dir is not None: shutil.rmtree(spill_dir, ignore_errors=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
     LOGGER.info("DONE!")
\ No newline at end of file
@@ -1,14 +1,12 @@
-from rendermite.loader import MinecraftModel, ElementFace, ModelDisplay
-from trimesh.visual.texture import TextureVisuals
-from trimesh.visual.material import PBRMaterial
+from rendermite.loader import MinecraftModel, ModelDisplay
 from rendermite.matricies import *
-from typing import Dict, List
+from rendermite.textures import load_texture
+from typing import TYPE_CHECKING, Dict, List, Tuple
 from PIL import Image
-import trimesh.util
 import numpy as np
-import pyrender
-import trimesh
-import os
+
+# pyrender is only imported once a mesh is needed, as importing it is slow
+if TYPE_CHECKING: import pyrender
 
 FACE_DATA = {
     "DOWN": {"rotation":0,"normal":[0, -1, 0],"vertices":[[-.5, -.5, -.5],[0.5, -.5, -.5],[0.5, -.5, 0.5],[-.5, -.5, 0.5]]},
@@ -19,96 +17,118 @@ FACE_DATA = {
     "EAST": {"rotation":1,"normal":[1, 0, 0],"vertices":[[0.5, -.5, -.5],[0.5, 0.5, -.5],[0.5, 0.5, 0.5],[0.5, -.5, 0.5]]}
 }
 
-def load_texture(path:str) -> Image.Image:
-    """Loads the texture at the specified path"""
-    # Get specified texture or default if it does not exist
-    if not os.path.exists(path):
-        image = Image.new("RGBA", (2,2), (0,0,0))
-        image.putpixel((0,0),(248,0,248))
-        image.putpixel((1,1),(248,0,248))
-    else: image = Image.open(path).convert('RGBA')
-
-    # Crop image if it is animated
-    if os.path.exists(path+".mcmeta"):
-        width = image.width
-        image = image.crop((0, 0, width, width))
-    return image
-
-def rotate_list(list:list, amount:int):
-    """Rotates the list by the specified number of items"""
-    a = int(amount) % len(list)
-    return list[a:]+list[:a]
-
-def _generate_face(direction:str, texture:Image.Image, uv:List[float], rotation:int) -> trimesh.Trimesh:
-    # Get correct data from FACE_DATA
-    data = FACE_DATA.get(direction.upper())
-    rotate = data.get("rotation") + rotation/90
-    vertices = data.get("vertices")
-    normal = data.get("normal")
+FACE_INDEX = {k:i for i,k in enumerate(FACE_DATA)}
+FACE_VERTICES = np.array([v["vertices"] for v in FACE_DATA.values()])
+FACE_ROTATIONS = np.array([v["rotation"] for v in FACE_DATA.values()])
+FACE_TRIANGLES = [0, 1, 2, 2, 3, 0]
 
-    # Calculate UV coordinates
-    uv = np.divide(uv, 16)
-    uv = [uv[0], 1-uv[3], uv[2], 1-uv[1]]
-    uv = [uv[:2],[uv[2],uv[1]],uv[2:],[uv[0], uv[3]]]
-
-    # Generate Material and Trimesh
-    material = PBRMaterial(baseColorTexture=texture, alphaMode="MASK", alphaCutoff=0)
-    visual = TextureVisuals(material=material, uv=rotate_list(uv, rotate))
-    return trimesh.Trimesh(vertices, [[0, 1, 2 ,3]], [normal, normal], visual=visual, process=True, validate=True)
-
-def _generate_box(faces:Dict[str, ElementFace], transform:List[List[float]]=np.eye(4)) -> List[trimesh.Trimesh]:
-    meshes = []
-    # Generate the necessary faces for the box
-    for direction, face in faces.items():
-        mesh = _generate_face(direction, load_texture(face.texture), face.uv, face.rotation)
-        mesh.apply_transform(transform)
-        meshes.append(mesh)
-    return meshes
-
-def pyrender_converter(model:MinecraftModel) -> pyrender.Mesh:
-    """Converts a given `MinecraftModel` into a `pyrender.Mesh`"""
+_sampler:"pyrender.Sampler" = None
+
+ELEMENT_DTYPE = np.dtype([("start", float, 3), ("end", float, 3), ("pivot", float, 3), ("rotation", float, (3, 3))])
+FACE_DTYPE = np.dtype([("element", np.int32), ("direction", np.int8), ("uv", float, 4), ("rotation", np.int16), ("texture", np.int32)])
+
+# Minecraft only allows element rotations in steps of 22.5 degrees
+ROTATION_FUNCTIONS = {"x": rotx_mat, "y": roty_mat, "z": rotz_mat}
+ROTATION_MATRICES = {(axis, angle): np.array(f(angle))[:3, :3] for axis, f in ROTATION_FUNCTIONS.items() for angle in (-45, -22.5, 0, 22.5, 45)}
+IDENTITY_ROTATION = np.eye(3)
 
-    trimeshes = []
-    # Generate model elements
-    for element in model.elements:
-        size = np.subtract(element.end, element.start)
-        location = element.start
+def _rotation_matrix(axis:str, angle:float) -> np.ndarray:
+    matrix = ROTATION_MATRICES.get((axis, angle))
+    if matrix is None: matrix = np.array(ROTATION_FUNCTIONS[axis](angle))[:3, :3]
+    return matrix
 
-        # Get Rotation
-        pivot = [0, 0, 0]
+def compile_model(model:MinecraftModel) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Packs the elements and faces of the model into structured arrays of ``ELEMENT_DTYPE`` and ``FACE_DTYPE``.
+
+    Returns the distinct textures used by the model alongside the arrays, faces refer to them by index."""
+    elements, faces = [], []
+    textures:Dict[str, int] = {}
+    for i, element in enumerate(model.elements):
         rotation = element.rotation
-        x_rot, y_rot, z_rot = 0, 0, 0
-        if rotation is not None:
-            x_rot = rotation.angle if rotation.axis == "x" else 0
-            y_rot = rotation.angle if rotation.axis == "y" else 0
-            z_rot = rotation.angle if rotation.axis == "z" else 0
-            pivot = rotation.origin
-
-        # Compute Transformation Matrix
-        transform = multiply_matricies(
-            trans_mat(.5, .5, .5),
-            scale_mat(*size),
-            trans_mat(*location),
-            
-            trans_mat(*np.array(pivot) * -1),
-            rotx_mat(x_rot),
-            roty_mat(y_rot),
-            rotz_mat(z_rot),
-            trans_mat(*pivot)
-        )
-
-        trimeshes += _generate_box(element.faces, transform)
-    
-    mesh = pyrender.Mesh.from_trimesh(trimeshes, smooth=False)
-
-    # Set Texture Filtering
-    primitive:pyrender.Primitive
-    for primitive in mesh.primitives:
-        sampler = primitive.material.baseColorTexture.sampler
-        sampler.magFilter = pyrender.constants.GLTF.NEAREST
-        sampler.minFilter = pyrender.constants.GLTF.NEAREST
-
-    return mesh
+        if rotation is None: elements.append((element.start, element.end, (0, 0, 0), IDENTITY_ROTATION))
+        else: elements.append((element.start, element.end, rotation.origin, _rotation_matrix(rotation.axis, rotation.angle)))
+        for direction, face in element.faces.items():
+            texture = textures.setdefault(face.texture, len(textures))
+            faces.append((i, FACE_INDEX[direction.upper()], face.uv, face.rotation, texture))
+    return list(textures), np.array(elements, dtype=ELEMENT_DTYPE), np.array(faces, dtype=FACE_DTYPE)
+
+def generate_geometry(model:MinecraftModel) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Computes the triangle positions, normals and UVs of every face in the model at once.
+
+    Returns the distinct textures and the index of the texture used by each face alongside the geometry."""
+    textures, elements, faces = compile_model(model)
+    count = len(faces)
+    directions = faces["direction"].astype(int)
+
+    # Transform face vertices into model space, scaling and moving the unit cube to the element then rotating about its pivot
+    element = elements[faces["element"]]
+    size = element["end"] - element["start"]
+    offset = element["start"] + size * .5 - element["pivot"]
+    vertices = FACE_VERTICES[directions] * size[:, None] + offset[:, None]
+    vertices = np.matmul(vertices, element["rotation"].transpose(0, 2, 1)) + element["pivot"][:, None]
+
+    # Calculate UV coordinates
+    uv = faces["uv"] / 16
+    u0, v0, u1, v1 = uv[:, 0], 1-uv[:, 3], uv[:, 2], 1-uv[:, 1]
+    uv = np.stack([u0, v0, u1, v0, u1, v1, u0, v1], axis=1).reshape(count, 4, 2)
+    shift = np.trunc(FACE_ROTATIONS[directions] + faces["rotation"] / 90).astype(int) % 4
+    uv = uv[np.arange(count)[:, None], (np.arange(4) + shift[:, None]) % 4]
+
+    # Split quads into triangles and compute their normals
+    positions = vertices[:, FACE_TRIANGLES].reshape(count, 2, 3, 3)
+    a, b = positions[:, :, 1] - positions[:, :, 0], positions[:, :, 2] - positions[:, :, 0]
+    normals = a[..., [1, 2, 0]] * b[..., [2, 0, 1]] - a[..., [2, 0, 1]] * b[..., [1, 2, 0]]
+    length = np.linalg.norm(normals, axis=2, keepdims=True)
+    normals = np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+    normals = np.repeat(normals[:, :, None], 3, axis=2)
+    return textures, faces["texture"], positions, normals, uv[:, FACE_TRIANGLES].reshape(count, 2, 3, 2)
+
+def _get_sampler() -> "pyrender.Sampler":
+    global _sampler
+    import pyrender
+    if _sampler is None: _sampler = pyrender.Sampler(
+        magFilter=pyrender.constants.GLTF.NEAREST,
+        minFilter=pyrender.constants.GLTF.NEAREST
+    )
+    return _sampler
+
+def _generate_material(texture:Image.Image) -> "pyrender.MetallicRoughnessMaterial":
+    import pyrender
+    texture = pyrender.Texture(source=texture, source_channels="RGBA", sampler=_get_sampler())
+    return pyrender.MetallicRoughnessMaterial(baseColorTexture=texture, alphaMode="BLEND", alphaCutoff=0, doubleSided=False)
+
+def pyrender_converter(model:MinecraftModel) -> "pyrender.Mesh":
+    """Converts a given `MinecraftModel` into a `pyrender.Mesh`"""
+    return mesh_from_geometry(*generate_geometry(model))
+
+def mesh_from_geometry(textures:List[str], indices:np.ndarray, positions:np.ndarray, normals:np.ndarray, uvs:np.ndarray) -> "pyrender.Mesh":
+    """Converts the output of `generate_geometry` into a `pyrender.Mesh`"""
+    import pyrender
+
+    # Drop zero area triangles
+    valid = np.linalg.norm(normals[:, :, 0], axis=2) > 0
+
+    # Merge consecutive faces sharing a texture into one primitive, keeping draw order intact
+    materials:Dict[int, "pyrender.Material"] = {}
+    primitives = []
+    start = 0
+    ends = [*(np.flatnonzero(np.diff(indices)) + 1).tolist(), len(indices)] if len(indices) else []
+    for end in ends:
+        index = int(indices[start])
+        material = materials.get(index)
+        if material is None: material = materials[index] = _generate_material(load_texture(textures[index]))
+
+        mask = valid[start:end]
+        if mask.any(): primitives.append(pyrender.Primitive(
+            positions=positions[start:end][mask].reshape(-1, 3),
+            normals=normals[start:end][mask].reshape(-1, 3),
+            texcoord_0=uvs[start:end][mask].reshape(-1, 2),
+            material=material,
+            mode=pyrender.constants.GLTF.TRIANGLES
+        ))
+        start = end
+
+    return pyrender.Mesh(primitives)
 
 
 def get_display_matrix(display:ModelDisplay) -> List[List[float]]:
@@ -1,21 +1,79 @@
-from rendermite.exceptions import InvalidVersionError
-from io import BytesIO
+from rendermite.exceptions import InvalidVersionError, ChecksumMismatchError
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.error import URLError
+from typing import BinaryIO
 import urllib.request
+import hashlib
 import zipfile
 import logging
 import json
+import time
 import os
 
 LOGGER = logging.getLogger(__name__)
 
 VERSION_MANIFEST_URL = r"https://piston-meta.mojang.com/mc/game/version_manifest_v2.json"
+EXTRACT_DIRECTORIES = ("models", "textures")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_SPOOL_SIZE = 32 * 1024 * 1024
+CLIENT_JAR = "client.jar"
+
+MANIFEST_TTL = 60 * 60
+
+def download_assets(version:str, output:str, workers:int=None, cache:"AssetCache"=None, extract:bool=True) -> str:
+    """Downloads the Minecraft assets for the specified version into the specified output directory.
+
+    Without extracting, the client jar is used in place and only saved to the output directory if it is not cached.
+    Returns the base path to load assets from, either the output directory or the client jar."""
+    if cache is not None:
+        client = cache.get_client(version)
+        if not extract: return client
+        with open(client, "rb") as archive:
+            LOGGER.info("Extracting assets...")
+            extract_assets(archive, output, workers)
+        return output
 
-def download_assets(version:str, output:str):
-    """Downloads the Minecraft assets for the specified version into the specified output directory"""
     # LOCATE VERSION PACKAGE
-    with urllib.request.urlopen(VERSION_MANIFEST_URL) as response:
-        version_manifest = json.load(response)
+    package_info = _locate_package(_fetch_json(VERSION_MANIFEST_URL), version)
+    LOGGER.info("Fetching Package for %s %s", package_info["type"], package_info["id"])
+
+    # GET VERSION PACKAGE
+    version_package = _fetch_json(package_info["url"])
+
+    # DOWNLOAD ASSETS
+    LOGGER.info("Downloading assets...")
+    assets_url = version_package["downloads"]["client"]["url"]
+    if not extract:
+        os.makedirs(output, exist_ok=True)
+        with open(os.path.join(output, CLIENT_JAR), "wb") as file: _download(assets_url, file)
+        return os.path.join(output, CLIENT_JAR)
+    with SpooledTemporaryFile(DOWNLOAD_SPOOL_SIZE) as buffer:
+        _download(assets_url, buffer)
 
+        # EXTRACT ASSETS
+        LOGGER.info("Extracting assets...")
+        extract_assets(buffer, output, workers)
+    return output
+
+def _fetch(url:str) -> bytes:
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+def _fetch_json(url:str) -> dict:
+    return json.loads(_fetch(url))
+
+def _download(url:str, file:BinaryIO) -> str:
+    """Streams the url into the file, returning the sha1 of the downloaded content"""
+    digest = hashlib.sha1()
+    with urllib.request.urlopen(url) as response:
+        while chunk := response.read(DOWNLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            file.write(chunk)
+    return digest.hexdigest()
+
+def _locate_package(version_manifest:dict, version:str) -> dict:
+    """Finds the manifest entry for the specified version, resolving ``latest`` versions"""
     if version.startswith("latest"): # Get latest versions
         if version == "latest.release":
             version = version_manifest["latest"]["release"]
@@ -25,25 +83,120 @@ def download_assets(version:str, output:str):
 
     package_info = next((p for p in version_manifest["versions"] if p["id"] == version), None)
     if package_info is None: raise InvalidVersionError() # Ensure version exists
-    LOGGER.info("Fetching Package for %s %s", package_info["type"], package_info["id"])
+    return package_info
 
-    # GET VERSION PACKAGE
-    with urllib.request.urlopen(package_info["url"]) as response:
-        version_package = json.load(response)
-    
-    # DOWNLOAD ASSETS
-    LOGGER.info("Downloading assets...")
-    assets_url = version_package["downloads"]["client"]["url"]
-    with urllib.request.urlopen(assets_url) as response:
-        buffer = BytesIO(response.read())
-    
-    # EXTRACT ASSETS
-    LOGGER.info("Extracting assets...")
-    zip = zipfile.ZipFile(buffer)
-    for zip_path in zip.namelist():
-        if not zip_path.startswith("assets/"): continue
-        output_path = os.path.join(output, zip_path[7:])
-        directory, _ = os.path.split(output_path)
-        os.makedirs(directory, exist_ok=True)
-        with open(output_path, "wb") as file: file.write(zip.read(zip_path))
-    
+def _file_sha1(path:str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        while chunk := file.read(DOWNLOAD_CHUNK_SIZE): digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_file(path:str, data:bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path+".part", "wb") as file: file.write(data)
+    os.replace(path+".part", path)
+
+def _read_json(path:str) -> dict:
+    with open(path, "r", encoding="UTF-8") as file: return json.load(file)
+
+
+class AssetCache:
+    """A persistent cache of version packages and client jars, keyed by version id and sha1"""
+
+    def __init__(self, directory:str, manifest_ttl:float=MANIFEST_TTL) -> None:
+        self.directory = directory
+        self.manifest_ttl = manifest_ttl
+        self._used = set()
+
+    def get_manifest(self) -> dict:
+        """Gets the version manifest, reusing the cached copy while it is within the TTL"""
+        path = os.path.join(self.directory, "version_manifest_v2.json")
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.manifest_ttl:
+            return _read_json(path)
+        try: data = _fetch(VERSION_MANIFEST_URL)
+        except URLError as ex:
+            if not os.path.exists(path): raise
+            LOGGER.warning("Could not fetch version manifest, using cached copy: %s", ex)
+            return _read_json(path)
+        _write_file(path, data)
+        return json.loads(data)
+
+    def get_package(self, version:str) -> dict:
+        """Gets the version package for the specified version, only using the network if it is not cached.
+
+        Explicit version ids are served from the cache without consulting the manifest, allowing offline use."""
+        if not version.startswith("latest"):
+            path = self._version_path(version, "package.json")
+            if os.path.exists(path): return _read_json(path)
+
+        package_info = _locate_package(self.get_manifest(), version)
+        path = self._version_path(package_info["id"], "package.json")
+        if os.path.exists(path) and _file_sha1(path) == package_info.get("sha1"):
+            return _read_json(path)
+
+        LOGGER.info("Fetching Package for %s %s", package_info["type"], package_info["id"])
+        data = _fetch(package_info["url"])
+        _write_file(path, data)
+        return json.loads(data)
+
+    def get_client(self, version:str) -> str:
+        """Gets the path to the verified client jar for the specified version, downloading it if necessary"""
+        version_package = self.get_package(version)
+        client = version_package["downloads"]["client"]
+        path = self._version_path(version_package["id"], f"{client['sha1']}.jar")
+        self._used |= {path, self._version_path(version_package["id"], "package.json")}
+
+        if os.path.exists(path):
+            if _file_sha1(path) == client["sha1"]:
+                LOGGER.info("Using cached assets for %s", version_package["id"])
+                return path
+            LOGGER.warning("Cached assets for %s are corrupt, downloading again", version_package["id"])
+
+        LOGGER.info("Downloading assets...")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+".part", "wb") as file: sha1 = _download(client["url"], file)
+        if sha1 != client["sha1"]:
+            os.remove(path+".part")
+            raise ChecksumMismatchError(f"Expected {client['sha1']} but got {sha1}")
+        os.replace(path+".part", path)
+        return path
+
+    def prune(self):
+        """Removes every cached version file which was not used by this cache instance"""
+        if not self._used:
+            LOGGER.warning("Not pruning the cache as no version has been used from it")
+            return
+        root = os.path.join(self.directory, "versions")
+        if not os.path.exists(root): return
+        for directory, _, files in os.walk(root, topdown=False):
+            for file in files:
+                path = os.path.join(directory, file)
+                if path not in self._used:
+                    LOGGER.info("Pruning %s", path)
+                    os.remove(path)
+            if directory != root and not os.listdir(directory): os.rmdir(directory)
+
+    def _version_path(self, version:str, file:str) -> str:
+        return os.path.join(self.directory, "versions", version, file)
+
+
+def is_render_asset(zip_path:str) -> bool:
+    """Checks whether the jar entry is a model or texture used for rendering"""
+    segments = zip_path.split("/")
+    return len(segments) > 3 and segments[0] == "assets" and segments[2] in EXTRACT_DIRECTORIES and segments[-1] != ""
+
+def extract_assets(archive:BinaryIO, output:str, workers:int=None):
+    """Extracts the models and textures from the client jar into the specified output directory"""
+    with zipfile.ZipFile(archive) as zip:
+        members = [m for m in zip.namelist() if is_render_asset(m)]
+
+        # Create directories upfront so workers only write files
+        for directory in {os.path.dirname(m[7:]) for m in members}:
+            os.makedirs(os.path.join(output, directory), exist_ok=True)
+
+        def extract(zip_path:str):
+            with open(os.path.join(output, zip_path[7:]), "wb") as file: file.write(zip.read(zip_path))
+
+        with ThreadPoolExecutor(workers) as executor:
+            for _ in executor.map(extract, members): pass
+    LOGGER.info("Extracted %s assets", len(members))
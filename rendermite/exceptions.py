@@ -21,3 +21,18 @@ class FetchAssetsError(RendermiteError):
 
 class InvalidVersionError(FetchAssetsError):
     """The requested version package could not be found"""
+
+class ChecksumMismatchError(FetchAssetsError):
+    """The downloaded assets did not match the checksum in the version package"""
+
+class InvalidRequestError(RendermiteError):
+    """The render request sent to the server is invalid"""
+
+class MergeError(RendermiteError):
+    """The shard outputs could not be combined into a single output"""
+
+class RenderWorkerError(RendermiteError):
+    """The render worker could not render the item"""
+
+class AtlasError(RendermiteError):
+    """The images could not be packed into atlas sheets"""
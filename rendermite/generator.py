@@ -1,9 +1,19 @@
-from .converter import pyrender_converter, get_display_matrix, load_texture
-from rendermite.exceptions import MissingDisplayError, UnsupportedBuiltinError
-from .loader import MinecraftModel
+from .converter import generate_geometry, mesh_from_geometry, get_display_matrix
+from .sprites import composite_items
+from rendermite.exceptions import MissingDisplayError, UnsupportedBuiltinError, RenderWorkerError
+from .loader import MinecraftModel, get_repository
 from rendermite.matricies import *
+from rendermite.profiling import stage
+from multiprocessing.util import Finalize
+from typing import TYPE_CHECKING, List, Tuple
 from PIL import Image
-import pyrender
+import logging
+import math
+
+# pyrender is only imported once a renderer is created, as importing it is slow
+if TYPE_CHECKING: import pyrender
+
+LOGGER = logging.getLogger(__name__)
 
 RENDER_RESOLUTION = [1024, 1024]
 RENDER_AMBIENT_LIGHT = 32
@@ -12,61 +22,259 @@ RENDER_SIDE_LIGHT_POSE = multiply_matricies(
     roty_mat(-30),
     rotx_mat(-80)
 )
+RENDER_CAMERA_MAGNIFICATION = 9
+RENDER_CAMERA_POSE = [[ 1,  0,  0,  0],
+                      [ 0,  1,  0,  0],
+                      [ 0,  0,  1, 32],
+                      [ 0,  0,  0,  1]]
+
+# Batches are limited by the area of the framebuffer they are rendered into
+RENDER_BATCH_AREA = 2048 * 2048
+RENDER_BATCH_SIZE = 64
+
+# Items are rendered with OpenGL through pyrender, or rasterized by ``rendermite.rasterizer`` without it
+RENDER_BACKENDS = ["pyrender", "numpy", "auto"]
+# The auto backend rasterizes models with at most this many faces, a few boxes, and renders the rest with OpenGL
+RENDER_AUTO_FACES = 24
+
+_renderer:"ItemRenderer" = None
+_renderer_error:Exception = None
+_resolution:List[int] = RENDER_RESOLUTION
+_backend:str = "pyrender"
 
 
 def generate_item(path:str, base_path:str) -> Image.Image:
     """Gets the image used to represent the specified model in the GUI"""
-    model = MinecraftModel.from_file(path, base_path)
+    item = prepare_item(path, base_path)
+    if isinstance(item, ItemGeometry): return render_geometry(item)
+    return item
+
 
-    if model.builtin is None: return _render_item_model(model)
+def prepare_item(path:str, base_path:str) -> "Image.Image | ItemGeometry":
+    """Does all the work of generating the specified model which does not require OpenGL.
+
+    Returns the final image for generated items, or the ``ItemGeometry`` to pass to ``render_geometry``"""
+    with stage("load"): model = get_repository(base_path).get(path)
+    return prepare_model(model)
+
+def prepare_model(model:MinecraftModel) -> "Image.Image | ItemGeometry":
+    """Does all the work of generating an already loaded model which does not require OpenGL, see ``prepare_item``"""
+    if model.builtin is None: return _prepare_item_model(model)
     elif model.builtin == "builtin/generated": return _create_item_texture(model)
     else: raise UnsupportedBuiltinError(model.builtin)
 
 
+class ItemGeometry:
+    """The geometry and poses of an item model, ready to be rendered without the original model"""
+
+    def __init__(self, geometry:tuple, pose:List[List[float]], light_pose:List[List[float]]) -> None:
+        self.geometry = geometry
+        self.pose = pose
+        self.light_pose = light_pose
+
+
+@stage("composite")
 def _create_item_texture(model:MinecraftModel):
-    # GET AND SORT LAYERS
-    layers = [k for k in model.textures.keys() if k.startswith("layer")]
-    layers.sort()
-
-    # OPEN TEXTURES AND GET MAX SIZE
-    textures = []
-    max_size = [1, 1]
-    for key in layers:
-        tex = load_texture(model.textures.get(key))
-        if tex.size[0] > max_size[0]: max_size[0] = tex.size[0]
-        if tex.size[1] > max_size[1]: max_size[1] = tex.size[1]
-        textures.append(tex)
-    
-    # COMBINE TEXTURES INTO FINAL IMAGE
-    im = Image.new("RGBA", max_size, (0, 0, 0, 0))
-    for tex in textures: im.paste(tex, (0,0), tex)
-    return im
+    return composite_items([model])[0]
 
 
-def _render_item_model(model:MinecraftModel):
-    # ADD ITEM MESH
-    scene = pyrender.Scene(bg_color=[0, 0, 0, 0], ambient_light=(RENDER_AMBIENT_LIGHT, RENDER_AMBIENT_LIGHT, RENDER_AMBIENT_LIGHT))
+def _prepare_item_model(model:MinecraftModel) -> ItemGeometry:
     display = model.displays.get("gui")
     if display is None: raise MissingDisplayError()
     pose = get_display_matrix(display)
-    mesh = pyrender_converter(model)
-    scene.add(mesh, pose=pose)
 
     # SETUP DIRECTIONAL LIGHT
     if model.gui_light == "side":
         light_pose = RENDER_SIDE_LIGHT_POSE
     else: light_pose = np.eye(4)
-    light = pyrender.DirectionalLight(color=[1,1,1], intensity=RENDER_LIGHT_INTENSITY)
-    scene.add(light, pose=light_pose)
-
-    # SETUP CAMERA
-    camera = pyrender.OrthographicCamera(9, 9)
-    scene.add(camera, pose=[[ 1,  0,  0,  0],
-                            [ 0,  1,  0,  0],
-                            [ 0,  0,  1, 32],
-                            [ 0,  0,  0,  1]])
-
-    # RENDER SCENE INTO FINAL IMAGE
-    render = pyrender.OffscreenRenderer(*RENDER_RESOLUTION)
-    colour, _ = render.render(scene, pyrender.RenderFlags.RGBA)
-    return Image.fromarray(colour, "RGBA")
\ No newline at end of file
+
+    with stage("geometry"): geometry = generate_geometry(model)
+    return ItemGeometry(geometry, pose, light_pose)
+
+
+def _render_item_model(model:MinecraftModel):
+    return render_geometry(_prepare_item_model(model))
+
+
+def _rasterize(item:ItemGeometry) -> bool:
+    """Checks whether the backend for the current process rasterizes the item instead of using OpenGL"""
+    return _backend == "numpy" or (_backend == "auto" and len(item.geometry[1]) <= RENDER_AUTO_FACES)
+
+def _rasterize_geometry(item:ItemGeometry) -> Image.Image:
+    from rendermite.rasterizer import rasterize_geometry
+    with stage("render"): return rasterize_geometry(*item.geometry, item.pose, item.light_pose, _resolution)
+
+def render_geometry(item:ItemGeometry) -> Image.Image:
+    """Renders the prepared geometry of an item model using the backend for the current process"""
+    if _rasterize(item): return _rasterize_geometry(item)
+    with stage("mesh"): mesh = mesh_from_geometry(*item.geometry)
+    with stage("render"): return get_renderer().render(mesh, item.pose, item.light_pose)
+
+def render_geometries(items:List[ItemGeometry]) -> List[Image.Image]:
+    """Renders the prepared geometry of several item models in batches, see ``ItemRenderer.render_batch``"""
+    rasterized = {i: _rasterize_geometry(item) for i, item in enumerate(items) if _rasterize(item)}
+    if len(rasterized) == len(items): return list(rasterized.values())
+    rendered = iter(_render_batches([item for i, item in enumerate(items) if i not in rasterized]))
+    return [rasterized[i] if i in rasterized else next(rendered) for i in range(len(items))]
+
+def _render_batches(items:List[ItemGeometry]) -> List[Image.Image]:
+    renderer = get_renderer()
+    with stage("mesh"): meshes = [mesh_from_geometry(*item.geometry) for item in items]
+    images = []
+    size = get_batch_size(renderer.resolution)
+    for i in range(0, len(items), size):
+        batch = [(mesh, item.pose, item.light_pose) for mesh, item in zip(meshes[i:i+size], items[i:i+size])]
+        with stage("render"): images += renderer.render_batch(batch)
+    return images
+
+
+class ItemRenderer:
+    """A reusable offscreen renderer and scene used to render item models"""
+
+    def __init__(self, resolution:List[int]=RENDER_RESOLUTION) -> None:
+        import pyrender
+
+        # SETUP SCENE
+        self.scene = pyrender.Scene(bg_color=[0, 0, 0, 0], ambient_light=(RENDER_AMBIENT_LIGHT, RENDER_AMBIENT_LIGHT, RENDER_AMBIENT_LIGHT))
+        light = pyrender.DirectionalLight(color=[1,1,1], intensity=RENDER_LIGHT_INTENSITY)
+        self.light_node = self.scene.add(light)
+        camera = pyrender.OrthographicCamera(RENDER_CAMERA_MAGNIFICATION, RENDER_CAMERA_MAGNIFICATION)
+        self.scene.add(camera, pose=RENDER_CAMERA_POSE)
+
+        # CREATE CONTEXT
+        self.resolution = list(resolution)
+        self.renderer = pyrender.OffscreenRenderer(*resolution)
+        self._batch_fb = self._batch_cb = self._batch_size = None
+
+    def render(self, mesh:"pyrender.Mesh", pose:List[List[float]], light_pose:List[List[float]]) -> Image.Image:
+        """Renders the given mesh into an image using the specified pose and light pose"""
+        import pyrender
+        self.scene.set_pose(self.light_node, light_pose)
+        node = self.scene.add(mesh, pose=pose)
+        try: colour, _ = self.renderer.render(self.scene, pyrender.RenderFlags.RGBA)
+        finally: self.scene.remove_node(node)
+        return Image.fromarray(colour, "RGBA")
+
+    def render_batch(self, items:List[Tuple["pyrender.Mesh", List[List[float]], List[List[float]]]]) -> List[Image.Image]:
+        """Renders up to ``get_batch_size`` meshes, each with its pose and light pose, reading the images back together.
+
+        Each mesh is drawn exactly as ``render`` would before being resolved into its own tile of a larger framebuffer,
+        which is read back once for the whole batch without reading depth."""
+        import pyrender
+        from pyrender.constants import ProgramFlags
+        from OpenGL import GL
+        width, height = self.resolution
+        columns = math.ceil(math.sqrt(get_batch_size(self.resolution)))
+        rows = math.ceil(len(items) / columns)
+        flags = pyrender.RenderFlags.RGBA | pyrender.RenderFlags.OFFSCREEN
+        platform, renderer = self.renderer._platform, self.renderer._renderer
+
+        nodes = [self.scene.add(mesh, pose=pose) for mesh, pose, _ in items]
+        platform.make_current()
+        try:
+            renderer.viewport_width, renderer.viewport_height = width, height
+            renderer._update_context(self.scene, flags)
+            V, P = renderer._get_camera_matrices(self.scene)
+            camera = self.scene.get_pose(self.scene.main_camera_node)[:3,3]
+            for i, (node, (_, _, light_pose)) in enumerate(zip(nodes, items)):
+                # DRAW THE MESH, MIRRORING pyrender's FORWARD PASS
+                renderer._configure_forward_pass_viewport(flags)
+                GL.glClearColor(*self.scene.bg_color)
+                GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+                GL.glEnable(GL.GL_MULTISAMPLE)
+                self.scene.set_pose(self.light_node, light_pose)
+                program = None
+                for primitive in node.mesh.primitives if node.mesh.is_visible else []:
+                    program = renderer._get_primitive_program(primitive, flags, ProgramFlags.USE_MATERIAL)
+                    program._bind()
+                    program.set_uniform("V", V)
+                    program.set_uniform("P", P)
+                    program.set_uniform("cam_pos", camera)
+                    renderer._bind_lighting(self.scene, program, node, flags)
+                    renderer._bind_and_draw_primitive(primitive=primitive, pose=self.scene.get_pose(node), program=program, flags=flags)
+                    renderer._reset_active_textures()
+                if program is not None: program._unbind()
+
+                # RESOLVE INTO THE TILE
+                x, y = i % columns * width, i // columns * height
+                GL.glBindFramebuffer(GL.GL_READ_FRAMEBUFFER, renderer._main_fb_ms)
+                GL.glBindFramebuffer(GL.GL_DRAW_FRAMEBUFFER, self._get_batch_framebuffer(columns, rows))
+                GL.glBlitFramebuffer(0, 0, width, height, x, y, x + width, y + height, GL.GL_COLOR_BUFFER_BIT, GL.GL_LINEAR)
+
+            GL.glBindFramebuffer(GL.GL_READ_FRAMEBUFFER, self._batch_fb)
+            data = GL.glReadPixels(0, 0, width * columns, height * rows, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
+        finally:
+            for node in nodes: self.scene.remove_node(node)
+            platform.make_uncurrent()
+
+        # OpenGL rows start from the bottom, so each tile is flipped
+        colour = np.frombuffer(data, np.uint8).reshape(height * rows, width * columns, 4)
+        tiles = [(i // columns * height, i % columns * width) for i in range(len(items))]
+        return [Image.fromarray(colour[y:y+height, x:x+width][::-1], "RGBA") for y, x in tiles]
+
+    def _get_batch_framebuffer(self, columns:int, rows:int) -> int:
+        from OpenGL import GL
+        size = (self.resolution[0] * columns, self.resolution[1] * rows)
+        if self._batch_fb is not None and self._batch_size != size: self._delete_batch_framebuffer()
+        if self._batch_fb is None:
+            self._batch_cb = GL.glGenRenderbuffers(1)
+            GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self._batch_cb)
+            GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_RGBA, *size)
+            self._batch_fb = GL.glGenFramebuffers(1)
+            GL.glBindFramebuffer(GL.GL_DRAW_FRAMEBUFFER, self._batch_fb)
+            GL.glFramebufferRenderbuffer(GL.GL_DRAW_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0, GL.GL_RENDERBUFFER, self._batch_cb)
+            self._batch_size = size
+        return self._batch_fb
+
+    def _delete_batch_framebuffer(self):
+        from OpenGL import GL
+        if self._batch_fb is None: return
+        GL.glDeleteFramebuffers(1, [self._batch_fb])
+        GL.glDeleteRenderbuffers(1, [self._batch_cb])
+        self._batch_fb = self._batch_cb = self._batch_size = None
+
+    def delete(self):
+        """Frees the OpenGL context and any resources still held by it"""
+        if self.renderer is None: return
+        if self._batch_fb is not None:
+            self.renderer._platform.make_current()
+            self._delete_batch_framebuffer()
+        self.renderer.delete()
+        self.renderer = None
+
+
+def get_batch_size(resolution:List[int]=RENDER_RESOLUTION) -> int:
+    """Gets the number of items rendered together by ``ItemRenderer.render_batch`` at the resolution"""
+    return max(1, min(RENDER_BATCH_SIZE, RENDER_BATCH_AREA // (resolution[0] * resolution[1])))
+
+def init_renderer(resolution:List[int]=RENDER_RESOLUTION, backend:str="pyrender"):
+    """Sets the resolution and backend for the current process, suitable for use as a ``Pool`` initializer.
+
+    The OpenGL renderer is only created once an item needs it, so processes which never render never create one
+    and an initializer never fails because OpenGL is unavailable"""
+    global _resolution, _backend, _renderer_error
+    if backend not in RENDER_BACKENDS: raise ValueError(f"Unknown render backend '{backend}'")
+    _resolution, _backend, _renderer_error = list(resolution), backend, None
+    if _renderer is not None and _renderer.resolution != _resolution: release_renderer()
+
+def get_renderer() -> ItemRenderer:
+    """Gets the OpenGL renderer for the current process, creating it if necessary.
+
+    Raises ``RenderWorkerError`` if it cannot be created, without trying again until ``init_renderer`` is called"""
+    global _renderer, _renderer_error
+    if _renderer is None:
+        if _renderer_error is not None: raise RenderWorkerError(f"Could not create the renderer: {_renderer_error!r}")
+        try: _renderer = ItemRenderer(_resolution)
+        except Exception as ex:
+            LOGGER.exception("Could not create the renderer")
+            _renderer_error = ex
+            raise RenderWorkerError(f"Could not create the renderer: {ex!r}") from ex
+        Finalize(None, release_renderer, exitpriority=10)
+    return _renderer
+
+def release_renderer():
+    """Frees the renderer for the current process"""
+    global _renderer
+    if _renderer is None: return
+    _renderer.delete()
+    _renderer = None
@@ -1,8 +1,11 @@
 from typing import Dict, List, Tuple
-from rendermite.exceptions import OrphanModelError
+from rendermite.exceptions import LoaderError, OrphanModelError
+from rendermite.assets import OVERRIDES_LOCATION, get_index
 import json
 import os
 
+_repositories:Dict[str, "ModelRepository"] = {}
+
 def split_path(namespace:str, path:str) -> Tuple[str, str]:
     """Splits a minecraft formatted path into its namespace and path"""
     split = path.split(":")
@@ -17,10 +20,11 @@ def normalise_path(namespace:str, path:str) -> str:
 
 class MinecraftModel:
     """Represents a loaded Minecraft model"""
-    
+    __slots__ = ("model", "_base_path", "_overrides_path", "elements", "textures", "displays", "texture_size", "gui_light", "builtin")
+
     @classmethod
     def from_file(cls, path:str, base_path,
-    overrides_location = os.path.join(os.path.split(__file__)[0], "overrides")):
+    overrides_location = OVERRIDES_LOCATION):
         """Loads a Minecraft model from the specified model file"""
         subject = cls()
         subject.model = normalise_path("minecraft", path)
@@ -42,6 +46,24 @@ class MinecraftModel:
         self.gui_light = "side"
         self.builtin = None
 
+    def copy(self) -> "MinecraftModel":
+        """Creates a copy of this model which can be modified without affecting the original"""
+        subject = self.__class__()
+        subject._inherit(self)
+        subject.model = self.model
+        return subject
+
+    def _inherit(self, parent:"MinecraftModel"):
+        """Copies the properties of a resolved parent model into this model"""
+        self._base_path = parent._base_path
+        self._overrides_path = parent._overrides_path
+        self.elements = [e.copy(self) for e in parent.elements]
+        self.textures = parent.textures.copy()
+        self.displays = parent.displays.copy()
+        self.texture_size = parent.texture_size
+        self.gui_light = parent.gui_light
+        self.builtin = parent.builtin
+
     def get_texture_path(self, namespace:str, path:str) -> str:
         """Gets the path the the specified texture"""
         if path.startswith("#"): return path
@@ -51,9 +73,7 @@ class MinecraftModel:
     def get_path(self, *segments):
         """Gets the path to the joined segments, taking overrides into account."""
         base = os.path.join(*segments[:-1])+f".{segments[-1]}"
-        override = os.path.join(self._overrides_path, base)
-        if os.path.exists(override): return override
-        else: return os.path.abspath(os.path.join(self._base_path, base))
+        return get_index(self._base_path, self._overrides_path).locate(base)
 
     def _consolidate_textures(self):
         """Consolidates all texture variables to their final values"""
@@ -83,11 +103,15 @@ class MinecraftModel:
 
         # Load data
         location = self.get_path(namespace, "models", path, "json")
-        if not os.path.exists(location): raise OrphanModelError(f"Model file {namespace}:{path} does not exist")
-        data:dict = json.load(open(location, "r", encoding="UTF-8"))
+        index = get_index(self._base_path, self._overrides_path)
+        if not index.exists(location): raise OrphanModelError(f"Model file {namespace}:{path} does not exist")
+        with index.open(location) as file: data:dict = json.load(file)
 
-        # Enact on attributes
         if "parent" in data: self._load_model(namespace, data["parent"])
+        self._apply_data(namespace, data)
+
+    def _apply_data(self, namespace:str, data:dict):
+        """Applies the attributes of a parsed model file on top of the inherited properties"""
         if "textures" in data: self.textures |= {k:self.get_texture_path(namespace, v) for k,v in data["textures"].items()}
         if "elements" in data: self.elements += [ModelElement(self, namespace, e) for e in data["elements"]]
         if "display" in data: self.displays |= {k:ModelDisplay(v) for k,v in data["display"].items()}
@@ -96,6 +120,7 @@ class MinecraftModel:
 
 class ModelDisplay:
     """Represents one of a Minecraft model's display options"""
+    __slots__ = ("rotation", "translation", "scale")
 
     def __init__(self, data:dict) -> None:
         self.rotation:List[float] = data["rotation"] if "rotation" in data else [0, 0, 0]
@@ -105,6 +130,7 @@ class ModelDisplay:
 
 class ModelElement:
     """Represents an Element belonging to a `MinecraftModel`"""
+    __slots__ = ("model", "comment", "name", "start", "end", "faces", "rotation")
 
     def __init__(self, model:MinecraftModel, namespace:str, data:dict) -> None:
         self.model:MinecraftModel = model
@@ -115,6 +141,14 @@ class ModelElement:
         self.faces:Dict[str,ElementFace] = {k:ElementFace(k, namespace, v, self) for k,v in data["faces"].items()}
         self.rotation = ElementRotation(data["rotation"]) if "rotation" in data else None
 
+    def copy(self, model:MinecraftModel) -> "ModelElement":
+        """Creates a copy of this element belonging to the specified model"""
+        subject = self.__class__.__new__(self.__class__)
+        for slot in self.__slots__: setattr(subject, slot, getattr(self, slot))
+        subject.model = model
+        subject.faces = {k:v.copy(subject) for k,v in self.faces.items()}
+        return subject
+
     def __str__(self) -> str:
         if self.name is not None:
             display = self.name
@@ -129,6 +163,7 @@ class ModelElement:
 
 class ElementFace:
     """Represents a face belonging to one of a `MinecraftModel`'s `ModelElement`s"""
+    __slots__ = ("element", "direction", "uv", "texture", "rotation", "cullface")
 
     AUTO_UV = {
         "DOWN": [0, 2, 3, 5],
@@ -147,6 +182,13 @@ class ElementFace:
         self.rotation:int = data["rotation"] if "rotation" in data else 0
         self.cullface:str | None = data["cullface"] if "cullface" in data else None
 
+    def copy(self, element:ModelElement) -> "ElementFace":
+        """Creates a copy of this face belonging to the specified element"""
+        subject = self.__class__.__new__(self.__class__)
+        for slot in self.__slots__: setattr(subject, slot, getattr(self, slot))
+        subject.element = element
+        return subject
+
     def calculate_uv(self) -> List[float]:
         shape = self.element.start + self.element.end
         data = self.AUTO_UV.get(self.direction)
@@ -155,8 +197,73 @@ class ElementFace:
 
 class ElementRotation:
     """Represents the rotation of a `ModelElement`"""
+    __slots__ = ("angle", "axis", "origin")
 
     def __init__(self, data:dict) -> None:
         self.angle:float = data["angle"]
         self.axis:str = data["axis"]
         self.origin:List[int] = data["origin"]
+
+
+class ModelRepository:
+    """Loads Minecraft models, parsing each model file once and caching its resolved inheritance chain"""
+
+    def __init__(self, base_path:str, overrides_location:str = OVERRIDES_LOCATION) -> None:
+        self.base_path = base_path
+        self.overrides_location = overrides_location
+        self.index = get_index(base_path, overrides_location)
+        self._resolved:Dict[str, MinecraftModel] = {}
+
+    def get(self, path:str, textures:Dict[str, str]=None) -> MinecraftModel:
+        """Gets a consolidated copy of the specified model, equivalent to ``MinecraftModel.from_file``.
+
+        Texture variables can be replaced with other texture paths before they are consolidated."""
+        subject = self.resolve("minecraft", path).copy()
+        if textures: subject.textures |= textures
+        subject._consolidate_textures()
+        return subject
+
+    def resolve(self, namespace:str, path:str) -> MinecraftModel:
+        """Gets the cached, unconsolidated model with all inherited properties applied.
+
+        The returned model is shared and must not be modified, use ``get`` instead."""
+        key = normalise_path(namespace, path)
+        subject = self._resolved.get(key)
+        if subject is not None: return subject
+        namespace, path = split_path(namespace, path)
+
+        subject = MinecraftModel()
+        subject._base_path = self.base_path
+        subject._overrides_path = self.overrides_location
+
+        # Handle Builtins
+        if path.startswith("builtin/"): subject.builtin = path
+        else:
+            # Load data
+            location = subject.get_path(namespace, "models", path, "json")
+            if not self.index.exists(location): raise OrphanModelError(f"Model file {namespace}:{path} does not exist")
+            with self.index.open(location) as file: data:dict = json.load(file)
+
+            # Enact on attributes
+            if "parent" in data: subject._inherit(self.resolve(namespace, data["parent"]))
+            subject._apply_data(namespace, data)
+
+        subject.model = key
+        self._resolved[key] = subject
+        return subject
+
+    def preload(self, namespace:str = "minecraft", directory:str = "item"):
+        """Resolves every model in the specified models directory ahead of time"""
+        for file in self.index.listdir(os.path.join(namespace, "models", directory)):
+            name, extension = os.path.splitext(file)
+            if extension != ".json": continue
+            try: self.resolve(namespace, f"{directory}/{name}")
+            except LoaderError: pass # Reported when the model is requested
+
+
+def get_repository(base_path:str) -> ModelRepository:
+    """Gets the shared ``ModelRepository`` for the specified base path"""
+    repository = _repositories.get(base_path)
+    if repository is None:
+        repository = _repositories[base_path] = ModelRepository(base_path)
+    return repository
@@ -0,0 +1,77 @@
+from rendermite.assets import asset_exists, open_asset
+from rendermite.loader import MinecraftModel
+from typing import Dict
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+_file_hashes:Dict[str, str] = {}
+
+def file_hash(path:str) -> str:
+    """Gets the sha1 of the file at the specified path, caching the result per process"""
+    digest = _file_hashes.get(path)
+    if digest is None:
+        if asset_exists(path):
+            with open_asset(path) as file: digest = hashlib.sha1(file.read()).hexdigest()
+            # Animated textures are cropped based on the presence of the mcmeta file
+            if asset_exists(path+".mcmeta"): digest += ":animated"
+        else: digest = "missing"
+        _file_hashes[path] = digest
+    return digest
+
+def model_hash(model:MinecraftModel) -> str:
+    """Computes a hash of everything that affects the rendered output of the model.
+
+    Textures are identified by their content so the hash does not depend on where the assets were extracted."""
+    texture = lambda path: path if path.startswith("#") else file_hash(path)
+    description = {
+        "builtin": model.builtin,
+        "gui_light": model.gui_light,
+        "textures": {k:texture(v) for k,v in model.textures.items() if v is not None},
+        "displays": {k:[d.rotation, d.translation, d.scale] for k,d in model.displays.items()},
+        "elements": [[
+            e.start, e.end,
+            None if e.rotation is None else [e.rotation.angle, e.rotation.axis, e.rotation.origin],
+            {k:[f.uv, f.rotation, texture(f.texture)] for k,f in e.faces.items()}
+        ] for e in model.elements]
+    }
+    data = json.dumps([MANIFEST_VERSION, description], sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+def render_key(model:MinecraftModel) -> str:
+    """Computes a key identifying the image the model is generated as, so items with the same key generate identical images.
+
+    Only the properties used when generating are included, or ``None`` is returned if the model cannot be generated."""
+    if model.builtin == "builtin/generated":
+        layers = sorted(k for k in model.textures.keys() if k.startswith("layer"))
+        description = [model.builtin, [file_hash(model.textures[k]) for k in layers]]
+    elif model.builtin is None and "gui" in model.displays:
+        display = model.displays["gui"]
+        # Faces are kept in order as it decides the order they are drawn in
+        description = [model.gui_light == "side", [display.rotation, display.translation, display.scale], [[
+            e.start, e.end,
+            None if e.rotation is None else [e.rotation.angle, e.rotation.axis, e.rotation.origin],
+            [[k, f.uv, f.rotation, file_hash(f.texture)] for k,f in e.faces.items()]
+        ] for e in model.elements]]
+    else: return None
+    data = json.dumps([MANIFEST_VERSION, description])
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def read_manifest(output:str) -> dict:
+    """Reads the whole manifest in the output directory, or ``None`` if there is none or it is from another version"""
+    path = os.path.join(output, MANIFEST_FILE)
+    if not os.path.exists(path): return None
+    with open(path, "r", encoding="UTF-8") as file: data:dict = json.load(file)
+    return data if data.get("version") == MANIFEST_VERSION else None
+
+def save_manifest(output:str, items:Dict[str, str], settings:dict=None, shard:dict=None):
+    """Saves the item hashes into the output directory, along with the items assigned to the shard if it is one"""
+    path = os.path.join(output, MANIFEST_FILE)
+    data = {"version": MANIFEST_VERSION, "settings": settings, "items": dict(sorted(items.items()))}
+    if shard is not None: data["shard"] = shard
+    with open(path+".part", "w", encoding="UTF-8") as file: json.dump(data, file, indent=1)
+    os.replace(path+".part", path)
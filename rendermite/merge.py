@@ -0,0 +1,81 @@
+from rendermite.output import OutputSettings, ATLAS_INDEX, link_image, save_atlas
+from rendermite.manifest import read_manifest, save_manifest
+from rendermite.exceptions import MergeError
+from typing import Dict, List
+from collections import Counter
+from PIL import Image
+import logging
+import json
+import os
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _check_shards(shards:List[str]) -> List[dict]:
+    """Reads the manifest of every shard, checking together they cover every item exactly once"""
+    manifests = []
+    for directory in shards:
+        data = read_manifest(directory)
+        if data is None or data.get("shard") is None: raise MergeError(f"{directory} does not contain the output of a shard")
+        manifests.append(data)
+
+    first = manifests[0]
+    for directory, data in zip(shards, manifests):
+        if data["settings"] != first["settings"]: raise MergeError(f"{directory} was generated with different settings")
+        if any(data["shard"][k] != first["shard"][k] for k in ("count", "total", "digest")):
+            raise MergeError(f"{directory} was generated from a different set of items")
+
+    indexes = Counter(data["shard"]["index"] for data in manifests)
+    repeated = sorted(i for i, n in indexes.items() if n > 1)
+    if repeated: raise MergeError(f"Shards given more than once: {repeated}")
+    missing = sorted(set(range(1, first["shard"]["count"] + 1)) - indexes.keys())
+    if missing: raise MergeError(f"Shards missing: {missing}")
+
+    items = Counter(item for data in manifests for item in data["shard"]["items"])
+    duplicated = sorted(item for item, n in items.items() if n > 1)
+    if duplicated: raise MergeError(f"Items generated by more than one shard: {duplicated}")
+    if len(items) != first["shard"]["total"]: raise MergeError(f"Shards contain {len(items)} of {first['shard']['total']} items")
+    return manifests
+
+def _read_atlas(directory:str, images:Dict[str, Image.Image], aliases:Dict[str, str]):
+    """Crops every item out of the atlas in the directory, recording items sharing a rect as aliases"""
+    with open(os.path.join(directory, ATLAS_INDEX), "r", encoding="UTF-8") as file: index:dict = json.load(file)
+    sheets = [Image.open(os.path.join(directory, name)) for name in index["sheets"]]
+    rects = {}
+    for item, r in index["items"].items():
+        rect = (r["sheet"], r["x"], r["y"], r["width"], r["height"])
+        if rect in rects: aliases[item] = rects[rect]
+        else:
+            rects[rect] = item
+            images[item] = sheets[r["sheet"]].crop((r["x"], r["y"], r["x"]+r["width"], r["y"]+r["height"]))
+
+def merge_outputs(shards:List[str], output:str, compress_level:int=6):
+    """Combines the outputs generated by every shard into the output directory along with a manifest of every item.
+
+    Raises ``MergeError`` unless the shards were generated with the same settings and contain every item exactly once."""
+    manifests = _check_shards(shards)
+    settings = manifests[0]["settings"]
+    merged = OutputSettings(output, settings["sizes"], settings["format"], compress_level, settings["atlas"])
+    for directory in merged.directories().values(): os.makedirs(directory, exist_ok=True)
+
+    items:Dict[str, str] = {}
+    for data in manifests: items.update(data["items"])
+    if merged.atlas:
+        for size, directory in merged.directories().items():
+            images, aliases = {}, {}
+            for shard in shards: _read_atlas(OutputSettings(shard, merged.sizes).directories()[size], images, aliases)
+            missing = sorted(items.keys() - images.keys() - aliases.keys())
+            if missing: raise MergeError(f"Items missing from the shard atlases: {missing}")
+            save_atlas(images, directory, merged, aliases)
+    else:
+        for shard, data in zip(shards, manifests):
+            source = OutputSettings(shard, merged.sizes, merged.format)
+            for item in data["items"]:
+                for size, path in source.paths(item).items():
+                    if not os.path.exists(path): raise MergeError(f"{path} is missing from the shard output")
+                    link_image(path, merged.paths(item)[size])
+
+    failed = sum(len(data["shard"]["items"]) for data in manifests) - len(items)
+    if failed: LOGGER.warning(f"{failed} items could not be generated by the shards")
+    save_manifest(output, items, settings)
+    LOGGER.info(f"Merged {len(items)} items from {len(shards)} shards")
@@ -0,0 +1,168 @@
+from rendermite.exceptions import AtlasError
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from io import BytesIO
+from PIL import Image
+import shutil
+import json
+import math
+import os
+
+IMAGE_FORMATS = ["png", "webp"]
+ATLAS_SIZE = 4096
+ATLAS_INDEX = "atlas.json"
+
+_executor:ThreadPoolExecutor = None
+
+
+class OutputSettings:
+    """Describes how generated items are written into the output directory"""
+
+    def __init__(self, directory:str, sizes:List[int]=None, format:str="png", compress_level:int=6,
+    atlas:bool=False, atlas_size:int=ATLAS_SIZE, spill_dir:str=None) -> None:
+        self.directory = directory
+        self.sizes = sizes
+        self.format = format
+        self.compress_level = compress_level
+        self.atlas = atlas
+        self.atlas_size = atlas_size
+        self.spill_dir = spill_dir
+
+    def directories(self) -> Dict[int, str]:
+        """Gets the directory each output size is saved into, keyed by size"""
+        if not self.sizes: return {None: self.directory}
+        return {size: os.path.join(self.directory, str(size)) for size in self.sizes}
+
+    def paths(self, model:str) -> Dict[int, str]:
+        """Gets the file each output size of the item is saved to, keyed by size"""
+        return {size: os.path.join(d, f"{model}.{self.format}") for size, d in self.directories().items()}
+
+    def to_dict(self) -> dict:
+        """Gets the settings which affect the generated images, for recording in the manifest"""
+        return {"sizes": self.sizes, "format": self.format, "atlas": self.atlas}
+
+
+def _save_options(settings:OutputSettings) -> dict:
+    if settings.format == "webp": return {"lossless": True, "method": round(settings.compress_level * 6 / 9)}
+    return {"compress_level": settings.compress_level}
+
+def save_image(image:Image.Image, path:str, settings:OutputSettings):
+    """Encodes and saves the image using the format and compression level from the settings"""
+    # Replacing the file rather than writing into it keeps other items hard linked to it intact
+    with open(path+".part", "wb") as file: image.save(file, settings.format, **_save_options(settings))
+    os.replace(path+".part", path)
+
+def encode_image(image:Image.Image, settings:OutputSettings) -> bytes:
+    """Encodes the image in memory using the format and compression level from the settings"""
+    buffer = BytesIO()
+    image.save(buffer, settings.format, **_save_options(settings))
+    return buffer.getvalue()
+
+def save_images(images:Dict[str, Image.Image], settings:OutputSettings, wait:bool=True) -> List[Future]:
+    """Encodes and saves the images, keyed by path, in parallel using a thread pool shared by the process.
+
+    Unless waiting, returns as soon as the images are queued, the caller must wait for the returned futures."""
+    global _executor
+    if _executor is None: _executor = ThreadPoolExecutor()
+    futures = [_executor.submit(save_image, im, path, settings) for path, im in images.items()]
+    if wait:
+        for future in futures: future.result()
+    return futures
+
+def spill_outputs(model:str, outputs:Dict[int, Image.Image], settings:OutputSettings) -> Dict[int, "Image.Image | str"]:
+    """Saves the outputs of an item going into an atlas to the spill directory, returning the path of each.
+
+    Spilling keeps every image out of memory until the atlas is packed, unless the settings have no spill directory."""
+    if settings.spill_dir is None: return outputs
+    paths = {}
+    for size, image in outputs.items():
+        paths[size] = os.path.join(settings.spill_dir, f"{model}.{size}.png")
+        # Spilled images are read back once, so are compressed as little as possible
+        with open(paths[size], "wb") as file: image.save(file, "png", compress_level=1)
+    return paths
+
+def link_image(source:str, path:str):
+    """Makes the path refer to the saved image at the source, copying it if hard links are not supported"""
+    if os.path.lexists(path): os.remove(path)
+    try: os.link(source, path)
+    except OSError: shutil.copyfile(source, path)
+
+def resize_outputs(image:Image.Image, sizes:List[int]) -> Dict[int, Image.Image]:
+    """Resizes a generated item into each of the requested square output sizes.
+
+    Downscaling uses a box filter so every source pixel contributes, upscaling keeps pixels sharp."""
+    outputs = {}
+    for size in sizes:
+        if image.size == (size, size): outputs[size] = image
+        elif size < max(image.size): outputs[size] = image.resize((size, size), Image.Resampling.BOX)
+        else: outputs[size] = image.resize((size, size), Image.Resampling.NEAREST)
+    return outputs
+
+
+def layout_atlas(sizes:Dict[str, Tuple[int, int]], max_size:int=ATLAS_SIZE) -> List[Dict[str, List[int]]]:
+    """Lays images of the sizes out on as few sheets as possible, returning the rect of every image on each sheet.
+
+    Images are placed on shelves in order of decreasing height, starting a new sheet once one is full.
+    Raises ``AtlasError`` if an image is larger than a sheet."""
+    large = sorted(k for k, (w, h) in sizes.items() if w > max_size or h > max_size)
+    if large: raise AtlasError(f"Images larger than the {max_size}px sheets: {large}")
+    order = sorted(sizes, key=lambda k: (-sizes[k][1], -sizes[k][0], k))
+    area = sum(w * h for w, h in sizes.values())
+    width = min(max_size, max([math.ceil(math.sqrt(area))] + [w for w, _ in sizes.values()]))
+    sheets:List[Dict[str, List[int]]] = []
+    rects = None
+    x = y = shelf = 0
+    for key in order:
+        w, h = sizes[key]
+        if rects is not None and x + w > width: # Start next shelf
+            x, y, shelf = 0, y + shelf, 0
+        if rects is None or y + h > max_size: # Start next sheet
+            rects = {}
+            sheets.append(rects)
+            x = y = shelf = 0
+        rects[key] = [x, y, w, h]
+        x += w
+        shelf = max(shelf, h)
+    return sheets
+
+def _paste_sheet(images:Dict[str, "Image.Image | str"], rects:Dict[str, List[int]]) -> Image.Image:
+    """Pastes the images, or the images saved at the paths, onto a new sheet at their rects"""
+    sheet = Image.new("RGBA", (max(r[0]+r[2] for r in rects.values()), max(r[1]+r[3] for r in rects.values())), (0, 0, 0, 0))
+    for key, rect in rects.items():
+        if isinstance(images[key], str):
+            with Image.open(images[key]) as im: sheet.paste(im, rect[:2])
+        else: sheet.paste(images[key], rect[:2])
+    return sheet
+
+def _image_size(image:"Image.Image | str") -> Tuple[int, int]:
+    if not isinstance(image, str): return image.size
+    with Image.open(image) as im: return im.size # Only the header is read
+
+def pack_atlas(images:Dict[str, Image.Image], max_size:int=ATLAS_SIZE) -> List[Tuple[Image.Image, Dict[str, List[int]]]]:
+    """Packs the images into as few sheets as possible, returning each sheet with the rect of every image on it, see ``layout_atlas``"""
+    return [(_paste_sheet(images, rects), rects) for rects in layout_atlas({k:im.size for k, im in images.items()}, max_size)]
+
+def save_atlas(images:Dict[str, "Image.Image | str"], directory:str, settings:OutputSettings, aliases:Dict[str, str]=None):
+    """Packs the images into atlas sheets and saves them into the directory alongside a JSON index.
+
+    Images may be given as the paths of saved images, which are only opened while pasted so only the sheets being
+    pasted and saved are ever held in memory. Aliases are added to the index using the rect of the image they refer to,
+    without being packed again."""
+    sheets = layout_atlas({k:_image_size(im) for k, im in images.items()}, settings.atlas_size)
+    names = [f"atlas_{i}.{settings.format}" for i in range(len(sheets))]
+    saving:List[Future] = []
+    for name, rects in zip(names, sheets):
+        sheet = _paste_sheet(images, rects)
+        # Each sheet is pasted while the previous one is saved
+        for future in saving: future.result()
+        saving = save_images({os.path.join(directory, name): sheet}, settings, wait=False)
+    for future in saving: future.result()
+
+    index = {"sheets": names, "items": {}}
+    for i, rects in enumerate(sheets):
+        for key, rect in rects.items():
+            index["items"][key] = {"sheet": i, "x": rect[0], "y": rect[1], "width": rect[2], "height": rect[3]}
+    for alias, key in (aliases or {}).items():
+        if key in index["items"]: index["items"][alias] = index["items"][key]
+    index["items"] = dict(sorted(index["items"].items()))
+    with open(os.path.join(directory, ATLAS_INDEX), "w", encoding="UTF-8") as file: json.dump(index, file, indent=1)
@@ -0,0 +1,193 @@
+from rendermite.generator import ItemGeometry, prepare_item, render_geometry, render_geometries, init_renderer, get_renderer, release_renderer, get_batch_size
+from rendermite.profiling import record_item, record_error, merge_records, share_record, stage, init_instrumentation
+from rendermite.output import OutputSettings, save_image, spill_outputs, resize_outputs
+from rendermite.loader import MinecraftModel, get_repository
+from rendermite.sprites import process_sprites
+from rendermite.exceptions import RendermiteError, RenderWorkerError
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.context import BaseContext
+from multiprocessing import Queue
+from queue import Empty, Full
+from threading import Event, Semaphore, Thread
+from typing import Dict, List, Tuple
+from functools import partial
+from PIL import Image
+import multiprocessing
+import logging
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+PIPELINE_QUEUE_SIZE = 16
+# How often, in seconds, blocked queue operations check whether the render workers are still alive
+PIPELINE_POLL_INTERVAL = 0.5
+
+
+def estimate_cost(model:MinecraftModel) -> int:
+    """Estimates the relative cost of generating the model from the number of faces it has"""
+    if model.builtin is not None: return 1
+    return 1 + sum(len(e.faces) for e in model.elements)
+
+def order_by_cost(models:List[str], base:str) -> List[str]:
+    """Sorts the items so the most expensive are generated first"""
+    repository = get_repository(base)
+    def cost(model:str) -> int:
+        try: return estimate_cost(repository.resolve("minecraft", f"item/{model}"))
+        except RendermiteError: return 0
+    return sorted(models, key=lambda m: (-cost(m), m))
+
+
+def _prepare(model:str, base:str, settings:OutputSettings) -> Tuple[str, "ItemGeometry | Dict[int, Image.Image]", dict]:
+    """Loader stage, prepares the geometry of block items and completes generated items, spilling them when generating an atlas"""
+    with record_item(model) as record:
+        try: item = prepare_item(f"minecraft:item/{model}", base)
+        except RendermiteError as ex:
+            record_error(ex)
+            return model, None, record
+        if isinstance(item, ItemGeometry): return model, item, record
+        with stage("resize"): outputs = resize_outputs(item, settings.sizes) if settings.sizes else {None: item}
+        if settings.atlas:
+            with stage("spill"): outputs = spill_outputs(model, outputs, settings)
+        return model, outputs, record
+
+def _render_worker(resolution:List[int], settings:OutputSettings, jobs:Queue, results:Queue, trace_memory:bool=False, profile_dir:str=None, batch:bool=False, backend:str="pyrender"):
+    """Render stage, renders prepared geometry using one OpenGL context until a ``None`` job is received.
+
+    When batching, jobs already waiting are rendered together up to the batch size for the resolution.
+    If the renderer cannot be created the reason is sent as a result without an item and the worker exits."""
+    init_instrumentation(trace_memory, profile_dir)
+    try:
+        init_renderer(resolution, backend)
+        # Render workers exist only to render, so find out straight away if they cannot
+        if backend == "pyrender": get_renderer()
+    except Exception as ex:
+        LOGGER.exception("Could not start render worker")
+        with record_item(None) as record: record_error(ex)
+        results.put((None, None, record))
+        return
+    size = get_batch_size(resolution) if batch else 1
+    done = False
+    while not done:
+        waiting = [jobs.get()]
+        while waiting[-1] is not None and len(waiting) < size:
+            try: waiting.append(jobs.get_nowait())
+            except Empty: break
+        if waiting[-1] is None:
+            waiting.pop()
+            done = True
+        if not waiting: continue
+
+        outputs = [None] * len(waiting)
+        with record_item(None) as record:
+            try:
+                items = [item for _, item, _ in waiting]
+                images = render_geometries(items) if batch else [render_geometry(item) for item in items]
+                with stage("resize"): outputs = [resize_outputs(im, settings.sizes) if settings.sizes else {None: im} for im in images]
+                if settings.atlas:
+                    with stage("spill"): outputs = [spill_outputs(model, o, settings) for (model, _, _), o in zip(waiting, outputs)]
+            except Exception as ex: record_error(ex)
+        shares = [{"item": model, "stages": {}, "total": 0, "peak_memory": None, "error": record["error"]} for model, _, _ in waiting]
+        share_record(record, shares)
+        for (model, _, previous), output, share in zip(waiting, outputs, shares):
+            results.put((model, output, merge_records(previous, share)))
+    release_renderer()
+
+def _put(queue:Queue, item, workers:List[multiprocessing.Process]) -> bool:
+    """Puts the item on the queue unless every worker has exited, returning whether it was put"""
+    while any(worker.is_alive() for worker in workers):
+        try:
+            queue.put(item, timeout=PIPELINE_POLL_INTERVAL)
+            return True
+        except Full: pass
+    return False
+
+def _collect(results:Queue, models:List[str], settings:OutputSettings, outcomes:Dict[str, Tuple[dict, Dict[int, Image.Image]]],
+workers:List[multiprocessing.Process], fed:Event):
+    """Output stage, saves finished items on I/O threads as they arrive.
+
+    Items which will never arrive, because every render worker exited after all items were fed, are recorded as failed."""
+    slots = Semaphore(PIPELINE_QUEUE_SIZE)
+    def save(model:str, outputs:Dict[int, Image.Image], record:dict):
+        start = time.perf_counter()
+        try:
+            for size, path in settings.paths(model).items(): save_image(outputs[size], path, settings)
+            print(f"Generated {model}")
+        except OSError as ex:
+            LOGGER.warning("Error saving %s: %s", model, ex)
+            record_error(ex, record)
+        finally:
+            # Saving happens on another thread, so is timed here rather than as a stage
+            elapsed = time.perf_counter() - start
+            record["stages"]["save"] = elapsed
+            record["total"] += elapsed
+            slots.release()
+
+    remaining, failure, finished = set(models), None, False
+    with ThreadPoolExecutor() as executor:
+        while remaining:
+            try: model, outputs, record = results.get(timeout=PIPELINE_POLL_INTERVAL)
+            except Empty:
+                # Results sent just before the last worker exited are still received by waiting once more
+                if finished: break
+                finished = fed.is_set() and not any(worker.is_alive() for worker in workers)
+                continue
+            if model is None:
+                failure = record["error"]
+                continue
+            remaining.discard(model)
+            if record["error"] is not None:
+                LOGGER.warning("Error generating %s: %s", model, record["error"]["message"])
+                outcomes[model] = record, None
+            elif settings.atlas: outcomes[model] = record, outputs
+            else:
+                outcomes[model] = record, None
+                slots.acquire() # Bound the number of images waiting to be saved
+                executor.submit(save, model, outputs, record)
+
+    for model in sorted(remaining):
+        reason = failure["message"] if failure is not None else f"exit codes {[worker.exitcode for worker in workers]}"
+        record = {"item": model, "stages": {}, "total": 0, "peak_memory": None, "error": None}
+        record_error(RenderWorkerError(reason), record)
+        LOGGER.warning("Error generating %s: %s", model, record["error"]["message"])
+        outcomes[model] = record, None
+
+
+def run_pipeline(models:List[str], base:str, settings:OutputSettings, resolution:List[int],
+loaders:int=1, renderers:int=1, trace_memory:bool=False, profile_dir:str=None, context:BaseContext=None, batch:bool=False,
+backend:str="pyrender", sprites:List[List[str]]=()) -> Dict[str, Tuple[dict, Dict[int, Image.Image]]]:
+    """Generates the items using separate loading, rendering and saving stages connected by bounded queues.
+
+    Worker processes are started from the given multiprocessing context, or the default one.
+    Rendering processes render items waiting together when batching, see ``ItemRenderer.render_batch``, using the backend.
+    Batches of generated items, see ``process_sprites``, are generated by the loading processes alongside.
+    Returns the record of each item and, when generating an atlas, its images."""
+    context = context or multiprocessing.get_context()
+    jobs, results = context.Queue(PIPELINE_QUEUE_SIZE), context.Queue(PIPELINE_QUEUE_SIZE)
+    outcomes = {}
+
+    # Start the worker processes before the collector thread exists in this process
+    workers = [context.Process(target=_render_worker, args=(resolution, settings, jobs, results, trace_memory, profile_dir, batch, backend), daemon=True) for _ in range(renderers)]
+    for worker in workers: worker.start()
+
+    fed = Event()
+    with context.Pool(loaders, initializer=init_instrumentation, initargs=(trace_memory, profile_dir)) as pool:
+        collector = Thread(target=_collect, args=(results, models, settings, outcomes, workers, fed), daemon=True)
+        collector.start()
+        pending = pool.starmap_async(process_sprites, [(batch, base, settings) for batch in sprites])
+        prepare = partial(_prepare, base=base, settings=settings)
+        # Jobs are dropped once every render worker has exited, the collector fails them
+        for model, item, record in pool.imap_unordered(prepare, order_by_cost(models, base)):
+            if isinstance(item, ItemGeometry): _put(jobs, (model, item, record), workers)
+            else: results.put((model, item, record))
+        sprite_results = [r for batch in pending.get() for r in batch]
+        pool.close()
+        pool.join()
+
+    for _ in workers: _put(jobs, None, workers)
+    fed.set()
+    collector.join()
+    for worker in workers: worker.join()
+    # Jobs left behind by workers which exited early must not stop this process exiting
+    jobs.cancel_join_thread()
+    outcomes.update((record["item"], (record, outputs)) for record, outputs in sprite_results)
+    return outcomes
@@ -0,0 +1,143 @@
+from multiprocessing.util import Finalize
+from contextlib import contextmanager
+from typing import List
+from collections import Counter
+import tracemalloc
+import cProfile
+import logging
+import pstats
+import time
+import json
+import csv
+import os
+
+LOGGER = logging.getLogger(__name__)
+
+_record:dict = None
+_stack:List[float] = []
+_profiler:cProfile.Profile = None
+
+
+@contextmanager
+def record_item(model:str):
+    """Records the time spent in each stage and the peak memory while generating the item, yielding the record.
+
+    Peak memory is only measured while ``tracemalloc`` is tracing."""
+    global _record
+    record = {"item": model, "stages": {}, "total": 0, "peak_memory": None, "error": None}
+    previous, _record = _record, record
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try: yield record
+    finally:
+        record["total"] = time.perf_counter() - start
+        if tracing: record["peak_memory"] = tracemalloc.get_traced_memory()[1] - baseline
+        _record = previous
+
+@contextmanager
+def stage(name:str):
+    """Attributes the time spent within the block to the named stage of the item being recorded.
+
+    Time spent in nested stages is only attributed to the innermost stage."""
+    if _record is None:
+        yield
+        return
+    record = _record
+    _stack.append(0)
+    start = time.perf_counter()
+    try: yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = _stack.pop()
+        if _stack: _stack[-1] += elapsed
+        record["stages"][name] = record["stages"].get(name, 0) + elapsed - nested
+
+def record_error(ex:Exception, record:dict=None):
+    """Records the exception as the reason the item failed, defaulting to the item being recorded"""
+    record = record or _record
+    if record is not None: record["error"] = {"type": type(ex).__name__, "message": str(ex)}
+
+def share_record(batch:dict, records:List[dict]):
+    """Shares the time spent on a batch evenly between the records of the items in it, adding to their stages"""
+    for record in records:
+        for name, elapsed in batch["stages"].items(): record["stages"][name] = record["stages"].get(name, 0) + elapsed / len(records)
+        record["total"] += batch["total"] / len(records)
+        if batch["peak_memory"] is not None: record["peak_memory"] = max(record["peak_memory"] or 0, batch["peak_memory"])
+
+def merge_records(a:dict, b:dict) -> dict:
+    """Combines two records of the same item made by different processes"""
+    stages = dict(a["stages"])
+    for name, elapsed in b["stages"].items(): stages[name] = stages.get(name, 0) + elapsed
+    memory = [m for m in (a["peak_memory"], b["peak_memory"]) if m is not None]
+    return {
+        "item": a["item"],
+        "stages": stages,
+        "total": a["total"] + b["total"],
+        "peak_memory": max(memory) if memory else None,
+        "error": a["error"] or b["error"]
+    }
+
+
+def log_summary(records:List[dict], slowest:int=10):
+    """Logs the slowest items, the total time spent in each stage and the number of failures of each type"""
+    if not records: return
+    stages = Counter()
+    for record in records: stages.update(record["stages"])
+    total = sum(r["total"] for r in records)
+    LOGGER.info("Generated %s items in %.2fs of worker time", len(records), total)
+    for name, elapsed in stages.most_common():
+        LOGGER.info("  %-12s %8.2fs %6.1f%%", name, elapsed, elapsed / total * 100 if total else 0)
+
+    LOGGER.info("Slowest items:")
+    for record in sorted(records, key=lambda r: r["total"], reverse=True)[:slowest]:
+        memory = "" if record["peak_memory"] is None else f" peak {record['peak_memory'] / 1024 / 1024:.1f}MiB"
+        LOGGER.info("  %-32s %8.3fs%s", record["item"], record["total"], memory)
+
+    failures = Counter(r["error"]["type"] for r in records if r["error"] is not None)
+    for error, count in failures.most_common(): LOGGER.info("Failed with %s: %s items", error, count)
+
+def save_records(records:List[dict], path:str):
+    """Saves the item records as CSV if the path ends with ``.csv``, otherwise as JSON"""
+    if os.path.splitext(path)[1].lower() != ".csv":
+        with open(path, "w", encoding="UTF-8") as file: json.dump(records, file, indent=1)
+        return
+
+    stages = sorted({name for r in records for name in r["stages"]})
+    with open(path, "w", encoding="UTF-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["item", "total", "peak_memory", "error", *stages])
+        for r in records:
+            error = None if r["error"] is None else r["error"]["type"]
+            writer.writerow([r["item"], r["total"], r["peak_memory"], error, *(r["stages"].get(s, 0) for s in stages)])
+
+
+def init_instrumentation(trace_memory:bool=False, profile_dir:str=None):
+    """Starts tracing memory and profiling the current process, as requested"""
+    if trace_memory and not tracemalloc.is_tracing(): tracemalloc.start()
+    if profile_dir is not None: start_profiler(profile_dir)
+
+def start_profiler(directory:str):
+    """Profiles the current process, saving the results into the directory when the process exits"""
+    global _profiler
+    if _profiler is not None: return
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+    Finalize(None, stop_profiler, args=(directory,), exitpriority=20)
+
+def stop_profiler(directory:str):
+    """Stops profiling the current process and saves the results into the directory"""
+    global _profiler
+    if _profiler is None: return
+    _profiler.disable()
+    _profiler.dump_stats(os.path.join(directory, f"{os.getpid()}.prof"))
+    _profiler = None
+
+def merge_profiles(directory:str, path:str):
+    """Merges the profiles saved by every process into a single file"""
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".prof")]
+    if not files: return
+    pstats.Stats(*files).dump_stats(path)
+    LOGGER.info("Saved profile of %s processes to %s", len(files), path)
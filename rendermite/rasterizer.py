@@ -0,0 +1,129 @@
+from rendermite.generator import RENDER_AMBIENT_LIGHT, RENDER_LIGHT_INTENSITY, RENDER_CAMERA_POSE, RENDER_CAMERA_MAGNIFICATION
+from rendermite.textures import load_texture
+from typing import List
+from PIL import Image
+import numpy as np
+
+# Positions of the 4x multisample pattern within a pixel, in window coordinates starting from the bottom left
+RASTER_SAMPLES = np.array([[0.375, 0.125], [0.875, 0.375], [0.125, 0.625], [0.625, 0.875]], np.float32)
+# pyrender reads integer colours, such as the white light and the ambient light, as values out of 255
+RASTER_RADIANCE = RENDER_LIGHT_INTENSITY / 255
+RASTER_AMBIENT = RENDER_AMBIENT_LIGHT / 255
+# pyrender's default clipping planes
+RASTER_ZNEAR = 0.05
+RASTER_ZFAR = 100.0
+
+
+def _srgb_to_linear(srgb:np.ndarray) -> np.ndarray:
+    return np.where(srgb < 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+
+def _normalize(vectors:np.ndarray) -> np.ndarray:
+    return vectors / np.sqrt(np.einsum("...i,...i->...", vectors, vectors))[..., None]
+
+def _shade(texels:np.ndarray, normal:np.ndarray, positions:np.ndarray, light:np.ndarray, camera:np.ndarray) -> np.ndarray:
+    """Evaluates pyrender's metallic roughness shader for a fully metallic and rough material lit by one directional light"""
+    base = _srgb_to_linear(texels[:, :3] / 255)
+    v = _normalize(camera - positions)
+    h = _normalize(light + v)
+    nl = np.clip(light @ normal, 0.001, 1.0)
+    nv = np.clip(np.abs(v @ normal), 0.001, 1.0)[:, None]
+    vh = np.clip(np.einsum("ij,ij->i", v, h), 0.0, 1.0)[:, None]
+
+    # Fresnel, Smith occlusion with a roughness of 1 and the microfacet distribution which becomes constant
+    fresnel = base + (1 - base) * (1 - vh) ** 5
+    occlusion = nv / (nv * 0.5 + 0.5) * nl / (nl * 0.5 + 0.5)
+    specular = fresnel * occlusion / np.pi / (4 * nl * nv + 0.001)
+    colour = nl * RASTER_RADIANCE * specular + base * RASTER_AMBIENT
+    return np.clip(np.concatenate([colour ** (1 / 2.2), texels[:, 3:] / 255], axis=1), 0, 1)
+
+def _edges(x:np.ndarray, y:np.ndarray, a:np.ndarray, b:np.ndarray) -> np.ndarray:
+    return (b[0] - a[0]) * (y - a[1]) - (b[1] - a[1]) * (x - a[0])
+
+def _top_left(a:np.ndarray, b:np.ndarray) -> bool:
+    # With counter clockwise triangles and y pointing up, top edges point left and left edges point down
+    return (a[1] == b[1] and b[0] < a[0]) or b[1] < a[1]
+
+
+def rasterize_geometry(textures:List[str], indices:np.ndarray, positions:np.ndarray, normals:np.ndarray, uvs:np.ndarray,
+pose:List[List[float]], light_pose:List[List[float]], resolution:List[int]) -> Image.Image:
+    """Renders the output of ``generate_geometry`` in software, matching the OpenGL renderer as closely as possible.
+
+    Triangles are drawn in order with back face culling, a depth buffer, alpha blending and 4x multisampling,
+    shading and sampling textures once per pixel like OpenGL does."""
+    width, height = resolution
+    valid = np.linalg.norm(normals[:, :, 0], axis=2) > 0
+    faces = np.repeat(indices, 2).reshape(-1, 2)[valid]
+    positions, normals, uvs = positions[valid], normals[valid][:, 0], uvs[valid]
+
+    # Transform into world space then window coordinates
+    pose = np.asarray(pose, float)
+    world = positions @ pose[:3, :3].T + pose[:3, 3]
+    normals = _normalize(normals @ np.linalg.inv(pose[:3, :3]))
+    view = np.linalg.inv(np.asarray(RENDER_CAMERA_POSE, float))
+    eye = world @ view[:3, :3].T + view[:3, 3]
+    world, normals = world.astype(np.float32), normals.astype(np.float32)
+    window = np.stack([
+        (eye[..., 0] / RENDER_CAMERA_MAGNIFICATION + 1) * width / 2,
+        (eye[..., 1] / RENDER_CAMERA_MAGNIFICATION + 1) * height / 2,
+        ((2 * eye[..., 2] + RASTER_ZFAR + RASTER_ZNEAR) / (RASTER_ZNEAR - RASTER_ZFAR) + 1) / 2
+    ], axis=-1).astype(np.float32)
+    camera = np.asarray(RENDER_CAMERA_POSE, np.float32)[:3, 3]
+    light = _normalize(np.asarray(light_pose, np.float32)[:3, 2])
+
+    samples = len(RASTER_SAMPLES)
+    colour = np.zeros((height, width, samples, 4), np.uint8)
+    depth = np.ones((height, width, samples), np.float32)
+    images = {i: np.asarray(load_texture(textures[i])) for i in np.unique(faces)}
+    for t in range(len(window)):
+        v0, v1, v2 = window[t]
+        area = _edges(v0[0], v0[1], v1, v2)
+        if area <= 0: continue # Back facing or degenerate
+
+        # Evaluate coverage and depth at every sample within the bounds of the triangle
+        x0, y0 = np.maximum(np.floor(window[t, :, :2].min(axis=0)).astype(int), 0)
+        x1, y1 = np.minimum(np.ceil(window[t, :, :2].max(axis=0)).astype(int), [width, height])
+        if x0 >= x1 or y0 >= y1: continue
+        x = np.arange(x0, x1, dtype=np.float32)[None, :, None] + RASTER_SAMPLES[:, 0]
+        y = np.arange(y0, y1, dtype=np.float32)[:, None, None] + RASTER_SAMPLES[:, 1]
+        covered = None
+        for a, b in ((v1, v2), (v2, v0), (v0, v1)):
+            edge = _edges(x, y, a, b)
+            inside = edge >= 0 if _top_left(a, b) else edge > 0
+            covered = inside if covered is None else np.logical_and(covered, inside, out=covered)
+
+        # Depth is a plane across the triangle so only needs evaluating once per sample
+        zx, zy, zc = np.linalg.solve(np.column_stack([window[t, :, :2], np.ones(3)]), window[t, :, 2])
+        z = x * zx + (y * zy + zc)
+        tile = depth[y0:y1, x0:x1]
+        passed = covered & (z >= 0) & (z <= 1) & (z < tile)
+        # The four samples of a pixel are adjacent bytes so can be tested together as one integer
+        rows, columns = np.nonzero(passed.view(np.uint32)[..., 0])
+        if len(rows) == 0: continue
+
+        # Shade each pixel with a passing sample once, at its centre
+        cx, cy = x0 + columns + 0.5, y0 + rows + 0.5
+        b = np.stack([_edges(cx, cy, v1, v2), _edges(cx, cy, v2, v0), _edges(cx, cy, v0, v1)], axis=1) / area
+        uv = b @ uvs[t]
+        image = images[faces[t]]
+        u = np.floor(uv[:, 0] * image.shape[1]).astype(int) % image.shape[1]
+        v = np.floor(uv[:, 1] * image.shape[0]).astype(int) % image.shape[0]
+        source = _shade(image[image.shape[0] - 1 - v, u].astype(np.float32), normals[t], b @ world[t], light, camera)
+
+        # Blend into every passing sample, writing depth even where the texture is transparent
+        # Opaque pixels covering every sample replace whatever was there, so skip blending them
+        mask = passed[rows, columns]
+        opaque = (source[:, 3] == 1) & mask.all(axis=1)
+        colour[y0 + rows[opaque], x0 + columns[opaque]] = np.rint(source[opaque, None] * 255).astype(np.uint8)
+        rows, columns, source, mask = rows[~opaque], columns[~opaque], source[~opaque], mask[~opaque]
+        target = colour[y0 + rows, x0 + columns]
+        alpha = source[:, None, 3:]
+        blended = np.rint((source[:, None] * alpha + target / 255 * (1 - alpha)) * 255).astype(np.uint8)
+        colour[y0 + rows, x0 + columns] = np.where(mask[..., None], blended, target)
+        tile[passed] = z[passed]
+
+    # Resolve the samples and flip so rows start from the top
+    # Summing each sample separately is much faster than reducing over the short sample axis
+    resolved = colour[:, :, 0].astype(np.uint16) + samples // 2
+    for i in range(1, samples): resolved += colour[:, :, i]
+    resolved //= samples
+    return Image.fromarray(resolved[::-1].astype(np.uint8), "RGBA")
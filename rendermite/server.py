@@ -0,0 +1,315 @@
+"""Serves items rendered on demand over HTTP, keeping the OpenGL context, models and textures loaded between requests.
+
+Run with ``python -m rendermite.server -v [version]`` then request ``/render?item=diamond&size=64``."""
+from rendermite.exceptions import InvalidRequestError, OrphanModelError, MissingDisplayError, UnsupportedBuiltinError, RenderWorkerError
+from rendermite.generator import ItemGeometry, prepare_model, render_geometry, init_renderer, release_renderer, RENDER_RESOLUTION
+from rendermite.output import OutputSettings, encode_image, resize_outputs, IMAGE_FORMATS
+from rendermite.download import download_assets, AssetCache
+from rendermite.loader import split_path, get_repository
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+from urllib.parse import urlsplit, parse_qs
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+from threading import Lock, Thread
+from queue import Queue, Empty
+from PIL import Image
+import statistics
+import argparse
+import tempfile
+import hashlib
+import logging
+import base64
+import shutil
+import signal
+import json
+import time
+import re
+import os
+
+LOGGER = logging.getLogger(__name__)
+
+SERVER_CACHE_SIZE = 1024
+SERVER_BATCH_SIZE = 32
+SERVER_BATCH_WINDOW = 0.005
+SERVER_LATENCY_SAMPLES = 10000
+SERVER_MAX_SIZE = 4096
+SERVER_MAX_BODY = 16 * 1024 * 1024
+# How long, in seconds, a request waits for its item to be rendered
+SERVER_RENDER_TIMEOUT = 60
+ITEM_ID = re.compile(r"([a-z0-9_.-]+:)?[a-z0-9_-][a-z0-9_.-]*")
+RESOURCE_LOCATION = re.compile(r"([a-z0-9_.-]+:)?[a-z0-9_-][a-z0-9_.-]*(/[a-z0-9_-][a-z0-9_.-]*)*")
+DATA_URL_PREFIX = "data:image/png;base64,"
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+class RenderJob:
+    """An item waiting to be rendered, completed with the encoded image"""
+
+    def __init__(self, item:str, size:int, format:str, textures:Dict[str, str]) -> None:
+        self.item = item
+        self.size = size
+        self.format = format
+        self.textures = textures
+        self.future = Future()
+
+
+class ItemServer:
+    """Renders requested items on a single thread which owns the OpenGL context, caching the encoded results.
+
+    Requests arriving within ``SERVER_BATCH_WINDOW`` of each other are rendered as one batch,
+    rendering each distinct item once for every size and format requested of it."""
+
+    def __init__(self, base_path:str, resolution:List[int]=RENDER_RESOLUTION, compress_level:int=6, cache_size:int=SERVER_CACHE_SIZE) -> None:
+        self.base_path = base_path
+        self.resolution = resolution
+        self.settings = {f:OutputSettings(None, format=f, compress_level=compress_level) for f in IMAGE_FORMATS}
+        self.cache_size = cache_size
+        self.upload_dir = tempfile.mkdtemp(prefix="rendermite-uploads-")
+        self._cache:OrderedDict[tuple, bytes] = OrderedDict()
+        self._latencies = deque(maxlen=SERVER_LATENCY_SAMPLES)
+        self._counts = {"requests": 0, "cache_hits": 0, "renders": 0, "batches": 0, "errors": 0}
+        self._lock = Lock()
+        self._jobs:Queue = Queue()
+        self._failure:Exception = None
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Starts the render thread"""
+        self._thread.start()
+
+    def stop(self):
+        """Finishes the queued jobs, stops the render thread and removes uploaded textures"""
+        self._jobs.put(None)
+        self._thread.join()
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def render(self, item:str, size:int=None, format:str="png", textures:Dict[str, str]=None) -> bytes:
+        """Gets the encoded image of the item, rendering it if it is not cached.
+
+        Textures map texture variables to a resource location or a base64 PNG data URL."""
+        start = time.perf_counter()
+        try:
+            job = self._validate(item, size, format, textures or {})
+            key = (job.item, job.size, job.format, tuple(sorted(job.textures.items())))
+            with self._lock:
+                data = self._cache.get(key)
+                if data is not None:
+                    self._counts["cache_hits"] += 1
+                    self._cache.move_to_end(key)
+                    return data
+
+            # Jobs are never queued once the render thread has stopped, see ``_run``
+            with self._lock:
+                if self._failure is not None: raise RenderWorkerError(f"The render thread stopped: {self._failure!r}")
+                self._jobs.put(job)
+            try: data = job.future.result(timeout=SERVER_RENDER_TIMEOUT)
+            except TimeoutError: raise TimeoutError(f"Rendering {job.item} took longer than {SERVER_RENDER_TIMEOUT}s") from None
+            with self._lock:
+                self._cache[key] = data
+                while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+            return data
+        except Exception:
+            with self._lock: self._counts["errors"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._counts["requests"] += 1
+                self._latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        """Gets the request counts and latency percentiles in milliseconds"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counts, cached=len(self._cache))
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            stats["latency_ms"] = {"p50": percentiles[49] * 1000, "p90": percentiles[89] * 1000,
+                "p99": percentiles[98] * 1000, "max": latencies[-1] * 1000}
+        return stats
+
+    def _validate(self, item:str, size:"int | str", format:str, textures:Dict[str, str]) -> RenderJob:
+        if not isinstance(item, str) or not ITEM_ID.fullmatch(item): raise InvalidRequestError(f"Invalid item {item!r}")
+        if format not in IMAGE_FORMATS: raise InvalidRequestError(f"Format must be one of {', '.join(IMAGE_FORMATS)}")
+        if size is not None:
+            try: size = int(size)
+            except (TypeError, ValueError): raise InvalidRequestError(f"Invalid size {size!r}")
+            if not 0 < size <= SERVER_MAX_SIZE: raise InvalidRequestError(f"Size must be between 1 and {SERVER_MAX_SIZE}")
+        if not isinstance(textures, dict): raise InvalidRequestError("Textures must map texture variables to textures")
+
+        resolved = {}
+        for variable, texture in textures.items():
+            if not isinstance(texture, str): raise InvalidRequestError(f"Invalid texture for {variable!r}")
+            if texture.startswith(DATA_URL_PREFIX): resolved[variable] = self._store_upload(texture[len(DATA_URL_PREFIX):])
+            elif RESOURCE_LOCATION.fullmatch(texture): resolved[variable] = texture
+            else: raise InvalidRequestError(f"Invalid texture for {variable!r}")
+        return RenderJob(item, size, format, resolved)
+
+    def _store_upload(self, data:str) -> str:
+        """Saves an uploaded texture named by its content, so the texture cache never confuses two uploads"""
+        try: data = base64.b64decode(data, validate=True)
+        except ValueError: raise InvalidRequestError("Invalid base64 texture data")
+        path = os.path.join(self.upload_dir, hashlib.sha1(data).hexdigest()+".png")
+        with self._lock:
+            if not os.path.exists(path):
+                with open(path+".part", "wb") as file: file.write(data)
+                os.replace(path+".part", path)
+        return path
+
+    def _run(self):
+        batch:List[RenderJob] = []
+        try:
+            init_renderer(self.resolution)
+            while (job := self._jobs.get()) is not None:
+                # Collect the requests which arrived alongside the first
+                batch = [job]
+                deadline = time.perf_counter() + SERVER_BATCH_WINDOW
+                while len(batch) < SERVER_BATCH_SIZE:
+                    try: job = self._jobs.get(timeout=max(0, deadline - time.perf_counter()))
+                    except Empty: break
+                    if job is None:
+                        self._jobs.put(None) # Stop once this batch is done
+                        break
+                    batch.append(job)
+                self._render_batch(batch)
+        except Exception as ex:
+            LOGGER.exception("The render thread stopped")
+            with self._lock: self._failure = ex
+            # Fail every request waiting, later requests are failed before being queued
+            error = RenderWorkerError(f"The render thread stopped: {ex!r}")
+            for job in batch:
+                if not job.future.done(): job.future.set_exception(error)
+            while True:
+                try: job = self._jobs.get_nowait()
+                except Empty: break
+                if job is not None: job.future.set_exception(error)
+        finally: release_renderer()
+
+    def _render_batch(self, batch:List[RenderJob]):
+        groups:Dict[Tuple, List[RenderJob]] = {}
+        for job in batch: groups.setdefault((job.item, tuple(sorted(job.textures.items()))), []).append(job)
+        with self._lock:
+            self._counts["batches"] += 1
+            self._counts["renders"] += len(groups)
+
+        for jobs in groups.values():
+            try:
+                image = self._generate(jobs[0].item, jobs[0].textures)
+                sizes = {j.size for j in jobs if j.size is not None}
+                outputs = resize_outputs(image, sizes) if sizes else {}
+                outputs[None] = image
+                for job in jobs: job.future.set_result(encode_image(outputs[job.size], self.settings[job.format]))
+            except Exception as ex:
+                for job in jobs:
+                    if not job.future.done(): job.future.set_exception(ex)
+
+    def _generate(self, item:str, textures:Dict[str, str]) -> Image.Image:
+        repository = get_repository(self.base_path)
+        namespace, name = split_path("minecraft", item)
+        path = f"{namespace}:item/{name}"
+        if textures:
+            parent = repository.resolve(namespace, path)
+            textures = {k:v if os.path.isabs(v) else parent.get_texture_path(namespace, v) for k,v in textures.items()}
+        result = prepare_model(repository.get(path, textures))
+        return render_geometry(result) if isinstance(result, ItemGeometry) else result
+
+
+def _describe(ex:Exception) -> str:
+    return ": ".join(str(a) for a in ex.args)
+
+class ItemRequestHandler(BaseHTTPRequestHandler):
+    """Handles ``GET /render``, ``POST /render`` with a JSON body and ``GET /stats``"""
+    server_version = "rendermite"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/stats": return self._send_json(200, self.server.items.stats())
+        if url.path != "/render": return self._send_json(404, {"error": "Not found"})
+        query = {k:v[-1] for k,v in parse_qs(url.query).items()}
+        textures = {k[len("texture."):]:v for k,v in query.items() if k.startswith("texture.")}
+        self._render(query.get("item"), query.get("size"), query.get("format", "png"), textures)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/render": return self._send_json(404, {"error": "Not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVER_MAX_BODY: return self._send_json(413, {"error": "Request body too large"})
+        try: data = json.loads(self.rfile.read(length))
+        except ValueError: return self._send_json(400, {"error": "Request body must be JSON"})
+        if not isinstance(data, dict): return self._send_json(400, {"error": "Request body must be a JSON object"})
+        self._render(data.get("item"), data.get("size"), data.get("format", "png"), data.get("textures"))
+
+    def _render(self, item:str, size:"int | str", format:str, textures:Dict[str, str]):
+        try: data = self.server.items.render(item, size, format, textures)
+        except InvalidRequestError as ex: return self._send_json(400, {"error": _describe(ex)})
+        except OrphanModelError as ex: return self._send_json(404, {"error": _describe(ex)})
+        except (MissingDisplayError, UnsupportedBuiltinError) as ex: return self._send_json(422, {"error": _describe(ex)})
+        except Exception as ex:
+            LOGGER.exception("Error rendering %s", item)
+            return self._send_json(500, {"error": _describe(ex)})
+        self._send(200, CONTENT_TYPES[format], data)
+
+    def _send_json(self, status:int, data:dict):
+        self._send(status, "application/json", json.dumps(data).encode())
+
+    def _send(self, status:int, content_type:str, data:bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format:str, *args):
+        # Unix socket clients have no address to log
+        LOGGER.debug(format, *args)
+
+
+def create_server(items:ItemServer, host:str="127.0.0.1", port:int=8080, socket:str=None) -> "ThreadingHTTPServer | ThreadingUnixStreamServer":
+    """Creates an HTTP server for the items listening on the host and port, or the Unix socket if specified"""
+    if socket is None: server = ThreadingHTTPServer((host, port), ItemRequestHandler)
+    else:
+        if os.path.exists(socket): os.remove(socket)
+        server = ThreadingUnixStreamServer(socket, ItemRequestHandler)
+        server.daemon_threads = True
+    server.items = items
+    return server
+
+def serve(base_path:str, host:str="127.0.0.1", port:int=8080, socket:str=None, resolution:List[int]=RENDER_RESOLUTION,
+compress_level:int=6, cache_size:int=SERVER_CACHE_SIZE):
+    """Serves the items in the extracted assets until interrupted, logging the request statistics once stopped"""
+    get_repository(base_path).preload()
+    items = ItemServer(base_path, resolution, compress_level, cache_size)
+    items.start()
+    server = create_server(items, host, port, socket)
+    LOGGER.info("Listening on %s", socket or f"http://{host}:{port}")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        server.server_close()
+        items.stop()
+        if socket is not None and os.path.exists(socket): os.remove(socket)
+        LOGGER.info("Served %s", json.dumps(items.stats()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO", format="%(name)s [%(levelname)s] %(message)s")
+    logging.getLogger("OpenGL.acceleratesupport").setLevel("WARN")
+    logging.getLogger("PIL.PngImagePlugin").setLevel("WARN")
+    parser = argparse.ArgumentParser(prog="rendermite.server", description="Serves Minecraft item icons rendered on demand.")
+    parser.add_argument("-v", "--version", metavar="version", type=str, help="The version of Minecraft to render from.", default="latest", required=True)
+    parser.add_argument("-t", "--tempdir", metavar="path", type=str, help="The location minecraft assets are extracted to while serving.", default=r"./tmp/", required=False)
+    parser.add_argument("-c", "--cachedir", metavar="path", type=str, help="The location downloaded Minecraft versions are cached in between runs.", default=r"./cache/", required=False)
+    parser.add_argument("--no-extract", action="store_true", help="Read assets straight from the client jar instead of extracting them first.")
+    parser.add_argument("--host", metavar="host", type=str, help="The address to listen on.", default="127.0.0.1", required=False)
+    parser.add_argument("--port", metavar="port", type=int, help="The port to listen on.", default=8080, required=False)
+    parser.add_argument("--socket", metavar="path", type=str, help="Listen on this Unix socket instead of a port.", default=None, required=False)
+    parser.add_argument("-r", "--resolution", metavar="pixels", type=int, help="The resolution block items are rendered at.", default=1024, required=False)
+    parser.add_argument("--compress-level", metavar="0-9", type=int, choices=range(10), help="How hard to compress images, trading speed for size.", default=6, required=False)
+    parser.add_argument("--cache-size", metavar="", type=int, help="How many encoded images are kept in memory.", default=SERVER_CACHE_SIZE, required=False)
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # Stop cleanly when terminated
+    base = download_assets(args.version, args.tempdir, cache=AssetCache(args.cachedir), extract=not args.no_extract)
+    try: serve(base, args.host, args.port, args.socket, [args.resolution, args.resolution], args.compress_level, args.cache_size)
+    finally: shutil.rmtree(args.tempdir, ignore_errors=True)
@@ -0,0 +1,86 @@
+"""Generates ``builtin/generated`` items, which are composited from their layer textures without OpenGL.
+
+Nothing imported here may depend on OpenGL, so sprite workers stay lightweight."""
+from rendermite.output import OutputSettings, save_images, spill_outputs, resize_outputs
+from rendermite.profiling import record_item, stage
+from rendermite.textures import load_layer
+from rendermite.loader import MinecraftModel, get_repository
+from typing import Dict, List, Tuple
+from PIL import Image
+import numpy as np
+import time
+
+SPRITE_BATCH_SIZE = 64
+
+
+def get_layers(model:MinecraftModel) -> List[str]:
+    """Gets the texture of each layer of a generated item, from the bottom layer up"""
+    return [model.textures[k] for k in sorted(k for k in model.textures.keys() if k.startswith("layer"))]
+
+def alpha_over(destination:np.ndarray, source:np.ndarray):
+    """Composites the source over the destination in place, both RGBA arrays with values from 0 to 1 and premultiplied alpha"""
+    destination *= 1 - source[..., 3:]
+    destination += source
+
+def composite_items(models:List[MinecraftModel]) -> List[Image.Image]:
+    """Composites the layers of many generated items at once.
+
+    Items are grouped by the size of their largest layer, each group being composited one layer
+    at a time for every item together. Smaller layers are aligned to the top left corner."""
+    layers = [[load_layer(path) for path in get_layers(model)] for model in models]
+    groups:Dict[Tuple[int, int], List[int]] = {}
+    for i, arrays in enumerate(layers):
+        size = (max([1]+[a.shape[1] for a in arrays]), max([1]+[a.shape[0] for a in arrays]))
+        groups.setdefault(size, []).append(i)
+
+    images = [None] * len(models)
+    for (width, height), items in groups.items():
+        canvas = np.zeros((len(items), height, width, 4), np.float32)
+        source = np.empty_like(canvas)
+        for layer in range(max(len(layers[i]) for i in items)):
+            source.fill(0)
+            for j, i in enumerate(items):
+                if layer >= len(layers[i]): continue
+                array = layers[i][layer]
+                source[j, :array.shape[0], :array.shape[1]] = array
+            alpha_over(canvas, source)
+
+        # Convert back to straight alpha
+        alpha = canvas[..., 3:]
+        np.divide(canvas[..., :3], alpha, out=canvas[..., :3], where=alpha > 0)
+        sheet = Image.fromarray(np.rint(canvas * 255).astype(np.uint8).reshape(-1, width, 4), "RGBA")
+        for j, i in enumerate(items): images[i] = sheet.crop((0, j * height, width, (j + 1) * height))
+    return images
+
+
+def process_sprites(models:List[str], base:str, settings:OutputSettings) -> List[Tuple[dict, Dict[int, Image.Image]]]:
+    """Generates and saves a batch of generated items together, returning the record and, when generating an atlas, images of each.
+
+    Time spent on the whole batch is shared evenly between the records of its items."""
+    start = time.perf_counter()
+    repository = get_repository(base)
+    images = composite_items([repository.get(f"minecraft:item/{m}") for m in models])
+    share = (time.perf_counter() - start) / len(models)
+
+    results = []
+    saves = {}
+    for model, image in zip(models, images):
+        with record_item(model) as record:
+            with stage("resize"): outputs = resize_outputs(image, settings.sizes) if settings.sizes else {None: image}
+        record["stages"]["composite"] = share
+        record["total"] += share
+        if settings.atlas: results.append((record, spill_outputs(model, outputs, settings)))
+        else:
+            saves |= {path: outputs[size] for size, path in settings.paths(model).items()}
+            results.append((record, None))
+
+    # Encode every image in the batch in parallel
+    if saves:
+        start = time.perf_counter()
+        save_images(saves, settings)
+        share = (time.perf_counter() - start) / len(models)
+        for model, (record, _) in zip(models, results):
+            record["stages"]["save"] = share
+            record["total"] += share
+            print(f"Generated {model}")
+    return results
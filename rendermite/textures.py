@@ -0,0 +1,38 @@
+from rendermite.assets import asset_exists, open_asset
+from rendermite.profiling import stage
+from functools import lru_cache
+from PIL import Image
+import numpy as np
+
+TEXTURE_CACHE_SIZE = 512
+
+@lru_cache(maxsize=TEXTURE_CACHE_SIZE)
+def load_texture(path:str) -> Image.Image:
+    """Loads the texture at the specified path.
+
+    Decoded textures are cached per process and shared between callers, so the returned
+    image must not be modified. Use ``load_texture.cache_info()`` for hit and miss counts."""
+    with stage("texture"):
+        # Get specified texture or default if it does not exist
+        if not asset_exists(path):
+            image = Image.new("RGBA", (2,2), (0,0,0))
+            image.putpixel((0,0),(248,0,248))
+            image.putpixel((1,1),(248,0,248))
+        else:
+            with open_asset(path) as file: image = Image.open(file).convert('RGBA')
+
+        # Crop image if it is animated
+        if asset_exists(path+".mcmeta"):
+            width = image.width
+            image = image.crop((0, 0, width, width))
+        return image
+
+
+@lru_cache(maxsize=TEXTURE_CACHE_SIZE)
+def load_layer(path:str) -> np.ndarray:
+    """Loads the texture at the specified path as an RGBA array with values from 0 to 1 and premultiplied alpha.
+
+    Arrays are cached like ``load_texture`` so must not be modified."""
+    layer = np.asarray(load_texture(path), np.float32) / 255
+    layer[..., :3] *= layer[..., 3:]
+    return layer
@@ -0,0 +1,42 @@
+"""Tests finding the items to regenerate against the manifest of the previous run"""
+from rendermite.benchmark import generate_assets
+from rendermite.manifest import save_manifest
+from rendermite.output import OutputSettings
+from rendermite.cli import find_changed
+import pytest
+import os
+
+SETTINGS = {"resolution": 64, "sizes": None, "format": "png", "atlas": False}
+
+
+@pytest.fixture
+def previous(tmp_path):
+    """Generates a synthetic asset pack and the output of a previous run, which included an item since removed"""
+    base = str(tmp_path / "assets")
+    generate_assets(base, blocks=3, generated=3, multi=0)
+    output = OutputSettings(str(tmp_path / "output"))
+    os.makedirs(output.directory)
+    models = sorted(os.path.splitext(x)[0] for x in os.listdir(os.path.join(base, "minecraft", "models", "item")))
+    _, hashes = find_changed(models, base, output, SETTINGS)
+    for model in models + ["removed"]: open(output.paths(model)[None], "wb").close()
+    save_manifest(output.directory, {**hashes, "removed": "0"}, SETTINGS)
+    return base, output, models
+
+
+def test_unchanged(previous):
+    base, output, models = previous
+    assert find_changed(models, base, output, SETTINGS)[0] == []
+    assert not os.path.exists(output.paths("removed")[None])
+
+@pytest.mark.parametrize("force, settings", [(True, SETTINGS), (False, {**SETTINGS, "resolution": 32})])
+def test_removed_when_regenerating(previous, force, settings):
+    base, output, models = previous
+    assert find_changed(models, base, output, settings, force)[0] == models
+    assert not os.path.exists(output.paths("removed")[None])
+    assert all(os.path.exists(output.paths(m)[None]) for m in models)
+
+def test_removed_with_previous_format(previous):
+    base, output, models = previous
+    webp = OutputSettings(output.directory, format="webp")
+    assert find_changed(models, base, webp, {**SETTINGS, "format": "webp"})[0] == models
+    assert not os.path.exists(output.paths("removed")[None])
@@ -0,0 +1,127 @@
+"""Tests downloading and extracting assets against a local HTTP server standing in for Mojang's"""
+from rendermite.download import download_assets, is_render_asset, AssetCache, CLIENT_JAR
+from rendermite.exceptions import InvalidVersionError, ChecksumMismatchError
+from rendermite.assets import AssetIndex
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+from threading import Thread
+import rendermite.download
+import zipfile
+import hashlib
+import pytest
+import json
+import os
+
+VERSION = "1.0"
+
+# Only the models and textures, including animation metadata, are used for rendering
+JAR_ENTRIES = {
+    "assets/minecraft/models/item/stone.json": b'{"parent": "block/stone"}',
+    "assets/minecraft/models/block/stone.json": b'{"textures": {"all": "block/stone"}}',
+    "assets/minecraft/textures/block/stone.png": b"png",
+    "assets/minecraft/textures/block/water.png": b"animated png",
+    "assets/minecraft/textures/block/water.png.mcmeta": b'{"animation": {}}',
+    "assets/minecraft/sounds/ambient/cave.ogg": b"ogg",
+    "assets/minecraft/lang/en_us.json": b"{}",
+    "assets/minecraft/shaders/core/block.vsh": b"shader",
+    "assets/minecraft/font/default.json": b"{}",
+    "net/minecraft/client/Main.class": b"class",
+    "pack.png": b"png"
+}
+RENDER_ASSETS = {
+    os.path.join("minecraft", "models", "item", "stone.json"),
+    os.path.join("minecraft", "models", "block", "stone.json"),
+    os.path.join("minecraft", "textures", "block", "stone.png"),
+    os.path.join("minecraft", "textures", "block", "water.png"),
+    os.path.join("minecraft", "textures", "block", "water.png.mcmeta")
+}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format:str, *args): pass
+
+
+def _write_json(path:os.PathLike, data:dict) -> bytes:
+    content = json.dumps(data).encode()
+    with open(path, "wb") as file: file.write(content)
+    return content
+
+def _files(directory:str) -> set:
+    return {os.path.relpath(os.path.join(root, f), directory) for root, _, files in os.walk(directory) for f in files}
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Serves a synthetic version manifest, version package and client jar, returning the jar's content"""
+    root = tmp_path / "www"
+    root.mkdir()
+    with zipfile.ZipFile(root / "client.jar", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("assets/minecraft/models/", b"") # Directory entries are never extracted
+        for name, data in JAR_ENTRIES.items(): archive.writestr(name, data)
+    jar = (root / "client.jar").read_bytes()
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(root)))
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    package = _write_json(root / "package.json", {"id": VERSION, "type": "release", "downloads": {"client": {
+        "url": f"{url}/client.jar", "sha1": hashlib.sha1(jar).hexdigest(), "size": len(jar)
+    }}})
+    _write_json(root / "manifest.json", {"latest": {"release": VERSION, "snapshot": VERSION}, "versions": [
+        {"id": VERSION, "type": "release", "url": f"{url}/package.json", "sha1": hashlib.sha1(package).hexdigest()}
+    ]})
+    monkeypatch.setattr(rendermite.download, "VERSION_MANIFEST_URL", f"{url}/manifest.json")
+
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield jar
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_extracts_only_render_assets(server, tmp_path):
+    output = str(tmp_path / "assets")
+    assert download_assets(VERSION, output) == output
+    assert _files(output) == RENDER_ASSETS == {n[7:].replace("/", os.sep) for n in JAR_ENTRIES if is_render_asset(n)}
+    for name in RENDER_ASSETS:
+        with open(os.path.join(output, name), "rb") as file: assert file.read() == JAR_ENTRIES["assets/" + name.replace(os.sep, "/")]
+
+def test_latest_release(server, tmp_path):
+    output = str(tmp_path / "assets")
+    download_assets("latest.release", output)
+    assert _files(output) == RENDER_ASSETS
+
+def test_invalid_version(server, tmp_path):
+    with pytest.raises(InvalidVersionError): download_assets("0.0", str(tmp_path / "assets"))
+
+def test_cached_client(server, tmp_path):
+    cache = AssetCache(str(tmp_path / "cache"))
+    output = str(tmp_path / "assets")
+    download_assets(VERSION, output, cache=cache)
+    assert _files(output) == RENDER_ASSETS
+    with open(cache.get_client(VERSION), "rb") as file: assert file.read() == server
+
+def test_checksum_mismatch(server, tmp_path):
+    path = tmp_path / "www" / "client.jar"
+    path.write_bytes(path.read_bytes() + b"corrupt")
+    with pytest.raises(ChecksumMismatchError): AssetCache(str(tmp_path / "cache")).get_client(VERSION)
+
+def test_without_extracting(server, tmp_path):
+    output = str(tmp_path / "assets")
+    jar = download_assets(VERSION, output, extract=False)
+    assert jar == os.path.join(output, CLIENT_JAR)
+    assert _files(output) == {CLIENT_JAR}
+    with open(jar, "rb") as file: assert file.read() == server
+
+    # Assets are read from the jar in place, as though it had been extracted
+    index = AssetIndex(jar)
+    for name in RENDER_ASSETS:
+        path = os.path.join(jar, name)
+        assert index.exists(path)
+        with index.open(path) as file: assert file.read() == JAR_ENTRIES["assets/" + name.replace(os.sep, "/")]
+    assert not index.exists(os.path.join(jar, "minecraft", "sounds", "ambient", "cave.ogg"))
+    assert sorted(index.listdir(os.path.join("minecraft", "models", "item"))) == ["stone.json"]
+
+def test_cached_without_extracting(server, tmp_path):
+    cache = AssetCache(str(tmp_path / "cache"))
+    output = str(tmp_path / "assets")
+    assert download_assets(VERSION, output, cache=cache, extract=False) == cache.get_client(VERSION)
+    assert not os.path.exists(output)
@@ -0,0 +1,61 @@
+"""Tests generating items straight from a client jar matches generating them from extracted assets"""
+from rendermite.benchmark import generate_assets
+import subprocess
+import zipfile
+import shutil
+import pytest
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generates the items from the assets given instead of downloading them, in a fresh interpreter as run_generator removes them
+RUN_GENERATOR = (
+    "import sys, shutil\n"
+    "import rendermite.cli as cli\n"
+    "def download(version, output, *a, extract=True, **k):\n"
+    "    if not extract: return sys.argv[1]\n"
+    "    shutil.copytree(sys.argv[1], output)\n"
+    "    return output\n"
+    "cli.download_assets = download\n"
+    "cli.run_generator('', sys.argv[2], sys.argv[3], 2, resolution=32, backend='numpy', extract=not sys.argv[1].endswith('.jar'),\n"
+    "    pipeline=sys.argv[4] == 'pipeline', start_method=sys.argv[5])\n"
+)
+
+
+def _generate(assets:str, output:str, mode:str, start_method:str):
+    subprocess.run([sys.executable, "-c", RUN_GENERATOR, assets, output + ".tmp", output, mode, start_method],
+        check=True, capture_output=True, cwd=ROOT)
+
+def _images(directory:str) -> dict:
+    images = {}
+    for name in os.listdir(directory):
+        if not name.endswith(".png"): continue
+        with open(os.path.join(directory, name), "rb") as file: images[name] = file.read()
+    return images
+
+
+@pytest.fixture(scope="module")
+def assets(tmp_path_factory):
+    """Generates the synthetic assets both extracted and packed into a client jar, along with the images generated from them"""
+    root = tmp_path_factory.mktemp("jar")
+    extracted, jar = str(root / "assets"), str(root / "client.jar")
+    generate_assets(extracted, blocks=4, generated=4, multi=4)
+    with zipfile.ZipFile(jar, "w", zipfile.ZIP_DEFLATED) as archive:
+        for directory, _, files in os.walk(extracted):
+            for name in files:
+                path = os.path.join(directory, name)
+                archive.write(path, "assets/" + os.path.relpath(path, extracted).replace(os.sep, "/"))
+    _generate(extracted, str(root / "expected"), "pool", "spawn")
+    return extracted, jar, _images(str(root / "expected"))
+
+
+@pytest.mark.parametrize("mode", ["pool", "pipeline"])
+@pytest.mark.parametrize("start_method", ["spawn", "forkserver"])
+def test_jar_matches_extracted(assets, tmp_path, mode, start_method):
+    _, jar, expected = assets
+    output = str(tmp_path / "output")
+    _generate(jar, output, mode, start_method)
+    assert os.path.exists(jar) # The jar is read in place, never removed
+    images = _images(output)
+    assert len(images) > 8
+    assert images == expected
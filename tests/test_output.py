@@ -0,0 +1,42 @@
+"""Tests packing atlases from images in memory and images spilled to disk"""
+from rendermite.output import OutputSettings, ATLAS_INDEX, save_atlas, spill_outputs, layout_atlas
+from rendermite.exceptions import AtlasError
+from PIL import Image
+import pytest
+import json
+import os
+
+
+def _image(size:int, colour:int) -> Image.Image:
+    return Image.new("RGBA", (size, size), (colour, 255 - colour, 0, 255))
+
+def _read(directory:str) -> dict:
+    with open(os.path.join(directory, ATLAS_INDEX), "r", encoding="UTF-8") as file: index = json.load(file)
+    sheets = [Image.open(os.path.join(directory, name)).convert("RGBA") for name in index["sheets"]]
+    return {k: sheets[r["sheet"]].crop((r["x"], r["y"], r["x"]+r["width"], r["y"]+r["height"])).tobytes() for k, r in index["items"].items()}
+
+
+def test_spilled_atlas_matches_memory(tmp_path):
+    images = {f"item_{i}": _image(16 * (1 + i % 3), i * 10) for i in range(20)}
+    memory, spilled, spill = tmp_path / "memory", tmp_path / "spilled", tmp_path / "spill"
+    for directory in (memory, spilled, spill): directory.mkdir()
+
+    settings = OutputSettings(str(spilled), atlas=True, atlas_size=64, spill_dir=str(spill))
+    paths = {k: spill_outputs(k, {None: im}, settings)[None] for k, im in images.items()}
+    assert all(isinstance(p, str) and os.path.exists(p) for p in paths.values())
+    save_atlas(paths, str(spilled), settings, {"alias": "item_0"})
+    save_atlas(images, str(memory), OutputSettings(str(memory), atlas=True, atlas_size=64), {"alias": "item_0"})
+
+    assert len(os.listdir(spilled)) > 2 # Several sheets were needed
+    assert sorted(os.listdir(spilled)) == sorted(os.listdir(memory))
+    atlas = _read(str(spilled))
+    assert atlas == _read(str(memory))
+    assert atlas == {"alias": images["item_0"].tobytes(), **{k: im.tobytes() for k, im in images.items()}}
+
+def test_spill_without_directory():
+    outputs = {32: _image(32, 0)}
+    assert spill_outputs("item", outputs, OutputSettings(None, atlas=True)) is outputs
+
+def test_image_larger_than_sheet(tmp_path):
+    with pytest.raises(AtlasError, match="large"): layout_atlas({"small": (16, 16), "large": (128, 16)}, 64)
+    with pytest.raises(AtlasError): save_atlas({"large": _image(128, 0)}, str(tmp_path), OutputSettings(str(tmp_path), atlas=True, atlas_size=64))
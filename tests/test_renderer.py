@@ -0,0 +1,55 @@
+"""Tests only block items create the OpenGL renderer, and generation finishes failing only them when it cannot be created"""
+from rendermite.benchmark import generate_assets
+from rendermite.manifest import read_manifest
+from rendermite.cli import _init_worker, split_sprites
+from rendermite.sprites import process_sprites
+from rendermite.output import OutputSettings
+import rendermite.generator as generator
+import subprocess
+import pytest
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Forked workers inherit the renderer which can never be created
+RUN_GENERATOR = (
+    "import sys, rendermite.cli as cli, rendermite.generator as generator\n"
+    "def unavailable(resolution): raise RuntimeError('No OpenGL platform')\n"
+    "generator.ItemRenderer = unavailable\n"
+    "cli.download_assets = lambda version, output, *a, **k: output\n"
+    "cli.run_generator('', sys.argv[1], sys.argv[2], int(sys.argv[3]), resolution=32, start_method='fork',\n"
+    "    batch_render=sys.argv[4] == 'batch', pipeline=sys.argv[4] == 'pipeline')\n"
+)
+
+
+@pytest.mark.parametrize("processes, mode", [(0, "single"), (2, "single"), (2, "batch"), (2, "pipeline")])
+def test_renderer_unavailable(tmp_path, processes, mode):
+    assets, output = str(tmp_path / "assets"), str(tmp_path / "output")
+    generate_assets(assets, blocks=4, generated=4, multi=2)
+    process = subprocess.run([sys.executable, "-c", RUN_GENERATOR, assets, output, str(processes), mode],
+        capture_output=True, text=True, timeout=120, cwd=ROOT)
+    assert process.returncode == 0, process.stderr
+
+    # Generated items never need the renderer
+    items = read_manifest(output)["items"]
+    assert {f"generated_{i}" for i in range(4)} <= items.keys()
+    assert not [item for item in items if item.startswith(("cube_", "multi_"))]
+    assert all(os.path.exists(os.path.join(output, f"{item}.png")) for item in items)
+    assert "No OpenGL platform" in process.stderr
+
+def test_sprites_never_create_renderer(tmp_path, monkeypatch):
+    def unavailable(resolution): raise AssertionError("Generated items created a renderer")
+    monkeypatch.setattr(generator, "ItemRenderer", unavailable)
+    monkeypatch.setattr(generator, "_renderer", None)
+    assets, output = str(tmp_path / "assets"), str(tmp_path / "output")
+    generate_assets(assets, blocks=2, generated=4, multi=0)
+    os.makedirs(output)
+    models = sorted(os.path.splitext(x)[0] for x in os.listdir(os.path.join(assets, "minecraft", "models", "item")))
+
+    # Pool workers are initialised for rendering block items whenever there are any
+    _init_worker([32, 32], "pyrender", False, None)
+    sprites, renders = split_sprites(models, assets)
+    assert renders
+    results = process_sprites(sprites, assets, OutputSettings(output))
+    assert all(record["error"] is None for record, _ in results)
+    assert generator._renderer is None and generator._renderer_error is None
@@ -0,0 +1,74 @@
+"""Tests the server fails requests instead of hanging when its render thread cannot render them"""
+from rendermite.server import ItemServer, create_server
+from rendermite.exceptions import RenderWorkerError
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from threading import Event, Thread
+import rendermite.server
+import pytest
+import json
+import time
+
+
+@pytest.fixture
+def items(tmp_path):
+    items = ItemServer(str(tmp_path))
+    yield items
+    items.stop()
+
+
+def test_renderer_fails(items, monkeypatch):
+    def fail(resolution): raise RuntimeError("No OpenGL")
+    monkeypatch.setattr(rendermite.server, "init_renderer", fail)
+    items.start()
+    for _ in range(2):
+        with pytest.raises(RenderWorkerError, match="No OpenGL"): items.render("stone")
+    assert items.stats()["errors"] == 2
+
+def test_render_thread_dies(items, monkeypatch):
+    monkeypatch.setattr(rendermite.server, "init_renderer", lambda resolution: None)
+    started, release = Event(), Event()
+    def crash(self, batch):
+        started.set()
+        release.wait()
+        raise RuntimeError("Render thread crashed")
+    monkeypatch.setattr(ItemServer, "_render_batch", crash)
+    items.start()
+
+    # Requests queued behind the batch being rendered are failed with it
+    errors = []
+    def request(item:str):
+        try: items.render(item)
+        except RenderWorkerError as ex: errors.append(ex)
+    threads = [Thread(target=request, args=(item,)) for item in ("stone", "dirt")]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    while items._jobs.empty() and threads[1].is_alive(): time.sleep(0.01)
+    release.set()
+    for thread in threads: thread.join(5)
+    assert len(errors) == 2
+    with pytest.raises(RenderWorkerError, match="crashed"): items.render("stone")
+
+def test_render_timeout(items, monkeypatch):
+    monkeypatch.setattr(rendermite.server, "init_renderer", lambda resolution: None)
+    monkeypatch.setattr(rendermite.server, "SERVER_RENDER_TIMEOUT", 0.1)
+    release = Event()
+    monkeypatch.setattr(ItemServer, "_render_batch", lambda self, batch: release.wait())
+    items.start()
+    with pytest.raises(TimeoutError, match="stone"): items.render("stone")
+    release.set()
+
+def test_server_error(items, monkeypatch):
+    def fail(resolution): raise RuntimeError("No OpenGL")
+    monkeypatch.setattr(rendermite.server, "init_renderer", fail)
+    items.start()
+    server = create_server(items, port=0)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(HTTPError) as error: urlopen(f"http://127.0.0.1:{server.server_address[1]}/render?item=stone", timeout=5)
+        assert error.value.code == 500
+        assert "No OpenGL" in json.loads(error.value.read())["error"]
+    finally:
+        server.shutdown()
+        server.server_close()
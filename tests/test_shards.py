@@ -0,0 +1,89 @@
+"""Tests generating shards with the command line and merging them against an unsharded run of the synthetic asset pack"""
+from rendermite.benchmark import generate_assets
+from rendermite.manifest import read_manifest
+from rendermite.merge import merge_outputs
+from rendermite.exceptions import MergeError
+import subprocess
+import shutil
+import pytest
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs the command line with the assets already in the temporary directory instead of downloading them
+RUN_CLI = (
+    "import sys, runpy\n"
+    "import rendermite.cli as cli\n"
+    "cli.download_assets = lambda version, output, *a, **k: output\n"
+    "sys.argv = ['rendermite', *sys.argv[1:]]\n"
+    "runpy.run_module('rendermite', run_name='__main__')\n"
+)
+
+
+def _generate(assets:str, output:str, *args:str):
+    """Generates the items into the output in a fresh interpreter, as run_generator removes the assets it was given"""
+    temp = output + ".assets"
+    shutil.copytree(assets, temp)
+    subprocess.run([sys.executable, "-c", RUN_CLI, "-v", "synthetic", "-o", output, "-t", temp, "--no-cache", "-r", "32", "--backend", "numpy", *args],
+        check=True, capture_output=True, cwd=ROOT)
+
+def _files(directory:str) -> dict:
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            with open(os.path.join(root, name), "rb") as file: files[os.path.relpath(os.path.join(root, name), directory)] = file.read()
+    return files
+
+
+@pytest.fixture(scope="module")
+def outputs(tmp_path_factory):
+    """Generates the synthetic assets unsharded and as two shards"""
+    root = tmp_path_factory.mktemp("shards")
+    assets = str(root / "assets")
+    generate_assets(assets, blocks=6, generated=6, multi=4)
+    directories = {name: str(root / name) for name in ("full", "shard1", "shard2")}
+    _generate(assets, directories["full"])
+    _generate(assets, directories["shard1"], "--shard", "1/2")
+    _generate(assets, directories["shard2"], "--shard", "2/2")
+    directories["assets"] = assets
+    return directories
+
+
+def test_shards_partition_items(outputs):
+    shards = [read_manifest(outputs[s])["shard"] for s in ("shard1", "shard2")]
+    items = read_manifest(outputs["full"])["items"]
+    assert all(s["items"] for s in shards)
+    assert sorted(shards[0]["items"] + shards[1]["items"]) == sorted(items)
+
+def test_merge_matches_unsharded(outputs, tmp_path):
+    merged = str(tmp_path / "merged")
+    merge_outputs([outputs["shard1"], outputs["shard2"]], merged)
+    assert _files(merged) == _files(outputs["full"])
+    assert read_manifest(merged) == read_manifest(outputs["full"])
+
+def test_missing_shard(outputs, tmp_path):
+    with pytest.raises(MergeError, match="Shards missing"): merge_outputs([outputs["shard1"]], str(tmp_path / "merged"))
+
+def test_repeated_shard(outputs, tmp_path):
+    with pytest.raises(MergeError, match="more than once"): merge_outputs([outputs["shard1"], outputs["shard1"]], str(tmp_path / "merged"))
+
+def test_unsharded_output(outputs, tmp_path):
+    with pytest.raises(MergeError, match="does not contain"): merge_outputs([outputs["shard1"], outputs["full"]], str(tmp_path / "merged"))
+
+def test_mismatched_settings(outputs, tmp_path):
+    webp = str(tmp_path / "webp")
+    _generate(outputs["assets"], webp, "--shard", "2/2", "--format", "webp")
+    with pytest.raises(MergeError, match="different settings"): merge_outputs([outputs["shard1"], webp], str(tmp_path / "merged"))
+
+def test_mismatched_items(outputs, tmp_path):
+    fewer = str(tmp_path / "fewer")
+    generate_assets(fewer, blocks=5, generated=6, multi=4)
+    shard = str(tmp_path / "shard2")
+    _generate(fewer, shard, "--shard", "2/2")
+    with pytest.raises(MergeError, match="different set of items"): merge_outputs([outputs["shard1"], shard], str(tmp_path / "merged"))
+
+def test_missing_image(outputs, tmp_path):
+    shard = str(tmp_path / "shard2")
+    shutil.copytree(outputs["shard2"], shard)
+    os.remove(os.path.join(shard, next(iter(read_manifest(shard)["items"])) + ".png"))
+    with pytest.raises(MergeError, match="missing from the shard output"): merge_outputs([outputs["shard1"], shard], str(tmp_path / "merged"))